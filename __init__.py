@@ -2,19 +2,38 @@ from flask import Flask, render_template, abort
 from flask_bootstrap import Bootstrap5
 from flask_login import LoginManager
 from flask_mail import Mail
-from pymongo import MongoClient
+from pymongo.errors import PyMongoError
 from dotenv import load_dotenv
-import gridfs
 import os
 from .main import bp as main_bp
 from .ads import bp as ads_bp
 from .auth import bp as auth_bp
+from .api import bp as api_bp
 from .ads.routes import get_image
 from .utils import markdown_to_html
 from .auth.models import User
+from .auth.passwords import PasswordHasher
+from .auth.ratelimit import TokenBucketLimiter
+from .indexes import ensure_indexes
+from .search import get_search_backend
+from .signals import ad_changed
+from .ads.counts import AdCounter, invalidate_counts
+from .ads.popularity import ViewCounter
+from .facets import update_facet_counters
+from .cache import LRUByteCache, TTLCache, ResponseCache, invalidate_pages
+from .mailer import EmailDispatcher
+from .commands import register_commands
+from .metrics import Metrics, MongoCommandListener, register_metrics
+from .database import (MongoConnection, SecondaryReadRoute, pin_primary_reads, pool_options_from_env,
+                       primary_window_after_change, register_health, secondary_read_options,
+                       DEFAULT_SECONDARY_READ_ENDPOINTS)
+from .invalidation import InvalidationBus, publish_ad_changed
 
-def create_app(config_name='development'):
-    """App Factory pattern za kreiranje Flask aplikacije"""
+def create_app(config_name='development', mongo_client=None):
+    """App Factory pattern za kreiranje Flask aplikacije.
+
+    mongo_client zamjenjuje klijenta iz MONGODB_URI (npr. mongomock za benchmark).
+    """
     # Učitaj varijable iz .env datoteke
     load_dotenv()
     
@@ -22,6 +41,16 @@ def create_app(config_name='development'):
     
     # Konfiguracija iz .env datoteke (s fallback vrijednostima)
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'jako-jak-random-key')
+    # Najdublja stranica do koje se može skočiti brojem (dublje samo preko cursora)
+    app.config['PAGINATION_MAX_OFFSET_PAGES'] = int(os.getenv('PAGINATION_MAX_OFFSET_PAGES', 10))
+    # Broj dokumenata po getMore pozivu za izvoz (/api/ads)
+    app.config['API_BATCH_SIZE'] = int(os.getenv('API_BATCH_SIZE', 1000))
+    # Preklapanje nove sinkronizacije (updated_since) - pokriva upise koji su postali vidljivi nakon
+    # prethodne sinkronizacije, a updated_at im je postavljen prije nje (i razliku satova hostova)
+    app.config['API_SYNC_OVERLAP_SECONDS'] = int(os.getenv('API_SYNC_OVERLAP_SECONDS', 60))
+    # Najveća slika i najveći zahtjev (Werkzeug odbija veće zahtjeve s 413 prije obrade forme)
+    app.config['IMAGE_MAX_BYTES'] = int(os.getenv('IMAGE_MAX_BYTES', 8 * 1024 * 1024))
+    app.config['MAX_CONTENT_LENGTH'] = app.config['IMAGE_MAX_BYTES'] + 64 * 1024
     
     # Inicijalizacija ekstenzija
     bootstrap = Bootstrap5(app)
@@ -36,6 +65,14 @@ def create_app(config_name='development'):
     
     mail = Mail(app)
     
+    # Red za slanje emailova s ograničenim brojem radnika i ponovnim korištenjem SMTP veza
+    app.config['EMAIL_DISPATCHER'] = EmailDispatcher(
+        app,
+        workers=int(os.getenv('MAIL_WORKERS', 2)),
+        queue_size=int(os.getenv('MAIL_QUEUE_SIZE', 1000)),
+        max_retries=int(os.getenv('MAIL_MAX_RETRIES', 3))
+    )
+    
     # Inicijalizacija Flask-Login
     login_manager = LoginManager()
     login_manager.init_app(app)
@@ -43,23 +80,123 @@ def create_app(config_name='development'):
     login_manager.login_message = 'Molimo prijavite se za pristup ovoj stranici.'
     login_manager.login_message_category = 'info'
     
+    # Hashiranje lozinki u ograničenom poolu procesa (izvan niti zahtjeva); hash stare
+    # metode/parametara zamjenjuje se pri sljedećoj uspješnoj prijavi
+    app.config['PASSWORD_HASHER'] = PasswordHasher(
+        method=os.getenv('PASSWORD_HASH_METHOD', 'scrypt'),
+        workers=int(os.getenv('PASSWORD_HASH_WORKERS', 2)),
+        queue_size=int(os.getenv('PASSWORD_HASH_QUEUE_SIZE', 16)),
+        timeout=float(os.getenv('PASSWORD_HASH_TIMEOUT', 5))
+    )
+    
+    # Token bucket za prijavu/registraciju po IP adresi i po korisničkom imenu (0 isključuje limit)
+    for name, prefix, rate, burst in (('AUTH_IP_LIMITER', 'AUTH_IP', 30, 20),
+                                      ('AUTH_USER_LIMITER', 'AUTH_USER', 6, 10)):
+        rate = float(os.getenv(f'{prefix}_RATE_PER_MINUTE', rate))
+        app.config[name] = TokenBucketLimiter(
+            rate=rate / 60, burst=int(os.getenv(f'{prefix}_BURST', burst))
+        ) if rate > 0 else None
+    
     # User loader callback za Flask-Login
     @login_manager.user_loader
     def load_user(user_id):
         return User.get_by_id(user_id)
     
-    # MongoDB konekcija
-    client = MongoClient(os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'))
-    db = client[os.getenv('MONGODB_DB', 'pzw')]
+    # Mjerenje zahtjeva i MongoDB naredbi po endpointu (/metrics u Prometheus formatu)
+    metrics_enabled = os.getenv('METRICS_ENABLED', 'True').lower() in ('true', '1', 'yes')
+    app.config['METRICS'] = Metrics()
+    # Zahtjevi sporiji od ovoga (ms) logiraju se s popisom MongoDB naredbi; 0 isključuje log
+    app.config['SLOW_REQUEST_MS'] = int(os.getenv('SLOW_REQUEST_MS', 0))
+    # Veličina MongoDB odgovora (ponovno kodiranje svakog odgovora) - skupo, zadano isključeno
+    reply_bytes = os.getenv('METRICS_REPLY_BYTES', 'False').lower() in ('true', '1', 'yes')
+    event_listeners = [MongoCommandListener(app.config['METRICS'], reply_bytes)] if metrics_enabled else []
+    
+    # MongoDB konekcija - klijent se kreira lijeno u svakom procesu (sigurno uz fork), a
+    # DB/kolekcije/GRIDFS u app.config su proxyji na klijenta trenutnog procesa.
+    # Anonimni GET zahtjevi endpointa iz MONGODB_SECONDARY_READ_ENDPOINTS čitaju sa sekundarnih
+    # čvorova (secondaryPreferred uz maxStalenessSeconds); ostalo čita s primarnog
+    secondary_endpoints = os.getenv('MONGODB_SECONDARY_READ_ENDPOINTS', DEFAULT_SECONDARY_READ_ENDPOINTS)
+    mongo = MongoConnection(
+        os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'),
+        os.getenv('MONGODB_DB', 'pzw'),
+        options=pool_options_from_env(),
+        event_listeners=event_listeners,
+        client=mongo_client,
+        read_profiles={'secondary': secondary_read_options()},
+        route=SecondaryReadRoute((name.strip() for name in secondary_endpoints.split(',') if name.strip()),
+                                 primary_window=primary_window_after_change())
+    )
+    app.config['MONGO'] = mongo
+    db = mongo.proxy('db', routed=True)
     app.config['DB'] = db
-    app.config['ADS_COLLECTION'] = db['ads']
-    app.config['USERS_COLLECTION'] = db['users']
-    app.config['GRIDFS'] = gridfs.GridFS(db)
+    app.config['ADS_COLLECTION'] = mongo.proxy('ads', routed=True)
+    app.config['USERS_COLLECTION'] = mongo.proxy('users')
+    app.config['GRIDFS'] = mongo.proxy('gridfs', routed=True)
+    
+    # Pretraživač oglasa: 'text' (MongoDB tekstualni indeks) ili 'inverted' (aplikacijski indeks)
+    app.config['SEARCH_ENGINE'] = get_search_backend(os.getenv('SEARCH_BACKEND', 'text'))
+    
+    # Nakon promjene oglasa routed čitanja neko vrijeme idu s primarnog čvora - ispražnjeni cachevi
+    # se inače mogu napuniti sa sekundarnog koji promjenu još nema (prvi handler, prije brisanja cacheva)
+    ad_changed.connect(pin_primary_reads, app)
+    
+    # Keširani brojači oglasa (brišu se pri svakoj promjeni oglasa)
+    # Brojači oglasa po kategoriji i cjenovnom razredu za facete (kolekcija ads_facet_counts) - ažuriraju
+    # se prije brisanja keširanih brojeva da se u cache ne vrati stari broj
+    ad_changed.connect(update_facet_counters, app)
+    app.config['AD_COUNTER'] = AdCounter(ttl=int(os.getenv('COUNT_CACHE_TTL', 60)))
+    ad_changed.connect(invalidate_counts, app)
+    
+    # Cache naslovnice i prve stranice oglasa za anonimne posjetitelje
+    app.config['RESPONSE_CACHE'] = ResponseCache(ttl=int(os.getenv('RESPONSE_CACHE_TTL', 30)))
+    ad_changed.connect(invalidate_pages, app)
+    
+    # Kratkotrajni cache korisnika za user_loader (briše se pri promjeni profila/verifikaciji)
+    app.config['USER_CACHE'] = TTLCache(ttl=int(os.getenv('USER_CACHE_TTL', 30)), max_entries=10000)
+    
+    # Pregledi oglasa se skupljaju u memoriji i upisuju jednim bulk_write (periodično ili po broju oglasa)
+    app.config['VIEW_COUNTER'] = ViewCounter(
+        app,
+        flush_interval=float(os.getenv('VIEW_FLUSH_INTERVAL', 5)),
+        max_pending=int(os.getenv('VIEW_FLUSH_MAX_PENDING', 1000))
+    )
+    
+    # Cache čestih slika u memoriji procesa (budžet u bajtovima)
+    app.config['IMAGE_CACHE'] = LRUByteCache(
+        max_bytes=int(os.getenv('IMAGE_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+        max_object_size=int(os.getenv('IMAGE_CACHE_MAX_OBJECT_BYTES', 1024 * 1024))
+    )
+    
+    # Invalidacija cacheva u ostalim procesima/hostovima: 'capped' (tailable cursor, radi i na
+    # samostalnom mongod-u), 'changestream' (replica set) ili 'off' (zadano uz zadani mongo_client,
+    # npr. mongomock). Handler je zadnji - prosljeđuje promjenu oglasa tek nakon lokalnih handlera
+    invalidation_backend = os.getenv('INVALIDATION_BUS', 'off' if mongo_client is not None else 'capped').lower()
+    if invalidation_backend != 'off':
+        bus = InvalidationBus(app, mongo, backend=invalidation_backend,
+                              size=int(os.getenv('INVALIDATION_COLLECTION_BYTES', 1024 * 1024)))
+        app.config['INVALIDATION_BUS'] = bus
+        ad_changed.connect(publish_ad_changed, app)
+        app.before_request(bus.start)
+    
+    # Kreiranje indeksa pri pokretanju (idempotentno, može se isključiti)
+    if os.getenv('MONGODB_ENSURE_INDEXES', 'True').lower() in ('true', '1', 'yes'):
+        try:
+            ensure_indexes(db)
+        except PyMongoError as e:
+            app.logger.warning(f"Kreiranje indeksa nije uspjelo: {e}")
+    
+    # CLI naredbe (flask indexes create / flask indexes check)
+    register_commands(app)
+    
+    if metrics_enabled:
+        register_metrics(app)
+    register_health(app)
     
     # Registracija blueprint-a
     app.register_blueprint(main_bp)
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(ads_bp, url_prefix='/ads')
+    app.register_blueprint(api_bp, url_prefix='/api')
     
     # Dodaj route za slike na root level (bez /ads/ prefiksa)
     app.add_url_rule('/image/<image_id>', 'get_image', get_image)
@@ -92,5 +229,9 @@ def create_app(config_name='development'):
     def forbidden_error(error):
         return render_template('errors/403.html'), 403
     
+    @app.errorhandler(413)
+    def request_too_large_error(error):
+        return render_template('errors/413.html'), 413
+    
     return app
 
@@ -1,92 +1,311 @@
 #!/usr/bin/env python3
 """
-Skripta za dodavanje test podataka u MongoDB
-Generira 50 oglasa s različitim kategorijama i datuma
+Generator test podataka za MongoDB (za testiranje opterećenja)
+
+Korisnici i oglasi generiraju se u serijama paralelno u više procesa; svaki
+proces ima svoju MongoClient vezu i sam upisuje serije s
+insert_many(ordered=False), pa memorija ne ovisi o broju dokumenata.
+Raspodjela je neravnomjerna kao u produkciji: nekoliko kategorija ima većinu
+oglasa, noviji oglasi su češći, a mali broj korisnika objavljuje većinu oglasa.
+
+Primjeri:
+    python add_test_data.py --users 1000 --ads 100000
+    python add_test_data.py --users 100000 --ads 10000000 --workers 8 --batch-size 5000
+    python add_test_data.py --ads 5000 --image-ratio 0.3
+    python add_test_data.py clear
 """
 
-from faker import Faker
-from pymongo import MongoClient
-from datetime import datetime, timedelta
+import argparse
+import io
+import math
+import os
 import random
+import secrets
 import sys
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate
+from multiprocessing import Pool
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from faker import Faker
+from gridfs import GridFS
+from pymongo import MongoClient
+from werkzeug.security import generate_password_hash
+
+from facets import COUNTERS_COLLECTION, rebuild_facet_counters
+from images import AD_IMAGE_VARIANTS, Image, generate_variants
+from search import build_search_fields, get_search_backend
+from utils import render_description_fields
+
+# Kategorije oglasa s relativnom učestalošću
+CATEGORY_WEIGHTS = {
+    'Elektronika': 30,
+    'Automobili': 20,
+    'Dom i vrt': 15,
+    'Odjeća': 12,
+    'Sport': 10,
+    'Knjige': 8,
+    'Ostalo': 5,
+}
+
+# Medijan cijene po kategoriji (cijene su log-normalno raspodijeljene oko njega)
+CATEGORY_MEDIAN_PRICE = {
+    'Elektronika': 250,
+    'Automobili': 6000,
+    'Dom i vrt': 120,
+    'Odjeća': 30,
+    'Sport': 90,
+    'Knjige': 12,
+    'Ostalo': 40,
+}
+
+# Eksponent Zipfove raspodjele oglasa po korisnicima
+USER_SKEW = 1.1
+
+# Generirani korisnici, slike i lozinka za prijavu u testovima opterećenja
+TEST_USER_PREFIX = 'test_'
+TEST_IMAGE_PREFIX = 'test-'
+TEST_PASSWORD = 'test1234'
+
+# Stanje procesa radnika (postavlja ga _init_worker nakon fork-a)
+_worker = {}
+
+
+def _init_worker(uri, db_name, users, seed):
+    """Otvara vlastitu vezu prema MongoDB-u u svakom procesu radniku"""
+    client = MongoClient(uri)
+    db = client[db_name]
+    _worker['db'] = db
+    _worker['fs'] = GridFS(db)
+    _worker['fake'] = Faker('hr_HR')
+    _worker['seed'] = seed
+    _worker['search_engine'] = get_search_backend(os.getenv('SEARCH_BACKEND', 'text'))
+    _worker['users'] = users
+    if users:
+        _worker['user_cum_weights'] = list(accumulate(1 / (rank ** USER_SKEW) for rank in range(1, len(users) + 1)))
+
+
+def _batch_random(batch_no):
+    """Generator slučajnih brojeva za seriju (ponovljiv ako je zadan --seed)"""
+    seed = _worker['seed']
+    if seed is None:
+        return random.Random()
+    _worker['fake'].seed_instance(seed + batch_no)
+    return random.Random(seed + batch_no)
+
+
+def generate_user(fake, run_id, index, password_hash):
+    """Generira jednog korisnika (svi imaju lozinku TEST_PASSWORD)"""
+    return {
+        '_id': ObjectId(),
+        'username': f"{TEST_USER_PREFIX}{run_id}_{index}",
+        'email': f"{TEST_USER_PREFIX}{run_id}_{index}@example.com",
+        'password_hash': password_hash,
+        'email_verified': True,
+        'first_name': fake.first_name(),
+        'last_name': fake.last_name(),
+        'phone': fake.phone_number().replace(' ', ''),
+        'profile_image_id': None,
+        'profile_image_variants': {}
+    }
+
+
+def _insert_users(task):
+    """Generira i upisuje jednu seriju korisnika; vraća (id, prodavač, mobitel) za oglase"""
+    batch_no, start, count, run_id, password_hash = task
+    _batch_random(batch_no)
+    fake = _worker['fake']
+    users = [generate_user(fake, run_id, start + i, password_hash) for i in range(count)]
+    _worker['db']['users'].insert_many(users, ordered=False)
+    return [(u['_id'], f"{u['first_name']} {u['last_name']}", u['phone']) for u in users]
+
+
+def generate_image(rng, index):
+    """Sprema generiranu JPEG sliku (i njezine varijante) u GridFS"""
+    fs = _worker['fs']
+    image = Image.new('RGB', (1200, 900), tuple(rng.randrange(256) for _ in range(3)))
+    for _ in range(6):
+        x, y = rng.randrange(1100), rng.randrange(800)
+        box = Image.new('RGB', (rng.randrange(50, 400), rng.randrange(50, 300)),
+                        tuple(rng.randrange(256) for _ in range(3)))
+        image.paste(box, (x, y))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=85)
+    image_id = fs.put(buffer.getvalue(), filename=f"{TEST_IMAGE_PREFIX}{index}.jpg", content_type='image/jpeg')
+    variants = generate_variants(fs, image_id, AD_IMAGE_VARIANTS)
+    if variants:
+        _worker['db']['fs.files'].update_one({'_id': image_id}, {'$set': {'metadata.variants': variants}})
+    return image_id, variants
+
+
+def generate_ad(fake, rng, index, now, days, image_ratio, render):
+    """Generira jedan oglas s nasumičnim podacima (isti oblik kao oglas iz forme)"""
+    category = rng.choices(list(CATEGORY_WEIGHTS), weights=list(CATEGORY_WEIGHTS.values()))[0]
+    # Noviji oglasi su češći - starost je eksponencijalno raspodijeljena
+    age = min(rng.expovariate(5 / days), days)
+    created_at = now - timedelta(days=age)
+
+    users = _worker['users']
+    if users:
+        user_id, seller, phone = rng.choices(users, cum_weights=_worker['user_cum_weights'])[0]
+    else:
+        user_id, seller, phone = None, fake.name(), fake.phone_number().replace(' ', '')
 
-# Inicijalizacija faker-a
-fake = Faker('hr_HR')  # Hrvatski jezik
-
-# MongoDB konekcija
-client = MongoClient('mongodb://localhost:27017/')
-db = client['pzw']
-ads_collection = db['ads']
-
-# Kategorije oglasa
-CATEGORIES = [
-    'Elektronika', 'Dom i vrt', 'Automobili', 'Odjeća', 
-    'Sport', 'Knjige', 'Ostalo'
-]
-
-def generate_ad():
-    """Generira jedan oglas s nasumičnim podacima"""
-    # Nasumični datum u zadnjih 30 dana
-    days_ago = random.randint(0, 30)
-    created_at = datetime.now() - timedelta(days=days_ago)
-    
-    # Nasumična kategorija
-    category = random.choice(CATEGORIES)
-    
-    # Generiraj oglas
+    description = '\n\n'.join(fake.paragraphs(nb=rng.randint(1, 4)))
     ad = {
-        'title': fake.sentence(nb_words=random.randint(1,3)).rstrip('.'),
-        'description': fake.paragraph(nb_sentences=random.randint(2, 5)),
-        'price': round(random.uniform(10, 5000), 2),
+        'title': fake.sentence(nb_words=rng.randint(2, 5)).rstrip('.'),
+        'description': description,
+        'seller': seller,
+        'cellNo': phone,
+        'price': round(rng.lognormvariate(math.log(CATEGORY_MEDIAN_PRICE[category]), 1.0), 2),
         'category': category,
         'location': fake.city(),
-        'seller': fake.name(),
-        'cellNo': fake.phone_number().replace(' ', ''),
+        'image_id': None,
         'created_at': created_at,
-        'image_id': None  # Bez slika
+        'updated_at': created_at,
+        'user_id': user_id,
+        # Većina oglasa ima malo pregleda, rijetki jako puno (za sort=popular)
+        'views': int(rng.lognormvariate(3, 1.5))
     }
-    
+
+    if image_ratio and rng.random() < image_ratio:
+        ad['image_id'], ad['image_variants'] = generate_image(rng, index)
+
+    if render:
+        ad.update(render_description_fields(description))
+    ad['search'] = build_search_fields(ad)
     return ad
 
-def add_test_data(num_ads):
-    """Dodaje test podatke u bazu"""
-    print(f"Generiram {num_ads} test oglasa...")
-    
-    # Generiraj sve oglase
-    ads = []
-    for i in range(num_ads):
-        ad = generate_ad()
-        ads.append(ad)
-    
-    # Batch insert u bazu
-    print("Dodajem oglase u bazu...")
-    result = ads_collection.insert_many(ads)
-    
-    print(f"✅ Uspješno dodano {len(result.inserted_ids)} oglasa!")
-    
-
-def clear_test_data():
-    """Briše sve test podatke iz baze"""
-    print("Brišem sve oglase iz baze...")
-    result = ads_collection.delete_many({})
-    print(f"✅ Obrisano {result.deleted_count} oglasa!")
+
+def _insert_ads(task):
+    """Generira i upisuje jednu seriju oglasa; vraća broj upisanih oglasa"""
+    batch_no, start, count, now, days, image_ratio, render = task
+    rng = _batch_random(batch_no)
+    fake = _worker['fake']
+    ads = [generate_ad(fake, rng, start + i, now, days, image_ratio, render) for i in range(count)]
+    db = _worker['db']
+    db['ads'].insert_many(ads, ordered=False)
+    _worker['search_engine'].rebuild(db, ads)
+    return count
+
+
+def _batches(total, batch_size, *extra):
+    """Dijeli total dokumenata u serije (redni broj, početak, veličina, ...)"""
+    for batch_no, start in enumerate(range(0, total, batch_size)):
+        yield (batch_no, start, min(batch_size, total - start)) + extra
+
+
+def _run(pool, func, tasks, total, label):
+    """Izvršava serije paralelno i ispisuje napredak; vraća rezultate serija"""
+    results = []
+    done = 0
+    started = time.monotonic()
+    for result in pool.imap_unordered(func, tasks):
+        results.append(result)
+        done += result if isinstance(result, int) else len(result)
+        elapsed = time.monotonic() - started
+        print(f"\r  {label}: {done}/{total} ({done / max(elapsed, 1e-9):.0f}/s)", end='', flush=True)
+    print()
+    return results
+
+
+def add_test_data(uri, db_name, args):
+    """Dodaje korisnike pa oglase u bazu"""
+    seed = args.seed
+    users = []
+    if args.users:
+        print(f"Generiram {args.users} test korisnika (lozinka: {TEST_PASSWORD})...")
+        run_id = secrets.token_hex(3)
+        password_hash = generate_password_hash(TEST_PASSWORD)
+        tasks = _batches(args.users, args.batch_size, run_id, password_hash)
+        with Pool(args.workers, _init_worker, (uri, db_name, None, seed)) as pool:
+            for batch in _run(pool, _insert_users, tasks, args.users, 'korisnici'):
+                users.extend(batch)
+
+    image_ratio = args.image_ratio
+    if image_ratio and Image is None:
+        print("⚠️  Pillow nije instaliran - oglasi se generiraju bez slika")
+        image_ratio = 0
+
+    print(f"Generiram {args.ads} test oglasa...")
+    now = datetime.now()
+    tasks = _batches(args.ads, args.batch_size, now, args.days, image_ratio, not args.skip_render)
+    with Pool(args.workers, _init_worker, (uri, db_name, users, seed)) as pool:
+        total = sum(_run(pool, _insert_ads, tasks, args.ads, 'oglasi'))
+
+    # Oglasi su upisani mimo aplikacije pa se brojači za facete računaju ponovno
+    client = MongoClient(uri)
+    try:
+        rebuild_facet_counters(client[db_name])
+    finally:
+        client.close()
+
+    print(f"✅ Uspješno dodano {len(users)} korisnika i {total} oglasa!")
+
+
+def _delete_images(db, fs_files):
+    """Briše generirane slike, njihove varijante i chunkove u serijama"""
+    deleted = 0
+    while True:
+        ids = [doc['_id'] for doc in fs_files.find(
+            {'filename': {'$regex': f'^{TEST_IMAGE_PREFIX}'}}, {'_id': 1}).limit(1000)]
+        if not ids:
+            return deleted
+        variant_ids = [doc['_id'] for doc in fs_files.find({'metadata.variant_of': {'$in': ids}}, {'_id': 1})]
+        db['fs.chunks'].delete_many({'files_id': {'$in': ids + variant_ids}})
+        fs_files.delete_many({'_id': {'$in': ids + variant_ids}})
+        deleted += len(ids)
+
+
+def clear_test_data(uri, db_name):
+    """Briše sve oglase te generirane korisnike i slike iz baze"""
+    client = MongoClient(uri)
+    try:
+        db = client[db_name]
+        print("Brišem sve oglase iz baze...")
+        result = db['ads'].delete_many({})
+        db['ads_search_terms'].delete_many({})
+        db[COUNTERS_COLLECTION].delete_many({})
+        users = db['users'].delete_many({'username': {'$regex': f'^{TEST_USER_PREFIX}'}})
+        images = _delete_images(db, db['fs.files'])
+        print(f"✅ Obrisano {result.deleted_count} oglasa, {users.deleted_count} korisnika i {images} slika!")
+    finally:
+        client.close()
+
+
+def parse_args(argv):
+    """Argumenti naredbenog retka"""
+    parser = argparse.ArgumentParser(description='Generator test podataka za MongoDB')
+    parser.add_argument('command', nargs='?', choices=['generate', 'clear'], default='generate')
+    parser.add_argument('--ads', type=int, default=100, help='broj oglasa (zadano 100)')
+    parser.add_argument('--users', type=int, default=20, help='broj korisnika (zadano 20)')
+    parser.add_argument('--batch-size', type=int, default=1000, help='dokumenata po insert_many (zadano 1000)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='broj procesa (zadano broj CPU-a)')
+    parser.add_argument('--days', type=int, default=365, help='raspon datuma objave u danima (zadano 365)')
+    parser.add_argument('--image-ratio', type=float, default=0.0, help='udio oglasa sa slikom, 0-1 (zadano 0)')
+    parser.add_argument('--seed', type=int, default=None, help='sjeme za ponovljive podatke')
+    parser.add_argument('--skip-render', action='store_true',
+                        help='ne renderiraj opise (kasnije: flask --app app descriptions rerender)')
+    return parser.parse_args(argv)
+
 
 def main():
     """Glavna funkcija"""
+    args = parse_args(sys.argv[1:])
+    load_dotenv()
+    uri = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/')
+    db_name = os.getenv('MONGODB_DB', 'pzw')
 
-    
-    if len(sys.argv) > 1 and sys.argv[1] == 'clear':
-        clear_test_data()
-        return
-    
     try:
-        add_test_data(100)
-        
+        if args.command == 'clear':
+            clear_test_data(uri, db_name)
+        else:
+            add_test_data(uri, db_name, args)
     except Exception as e:
         print(f"❌ Greška: {e}")
         sys.exit(1)
-    finally:
-        client.close()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,74 @@
+from bson import ObjectId
+
+from ..cache import TTLCache
+from ..facets import get_facets
+from ..search import analyze
+
+
+class AdCounter:
+    """Keširani brojači oglasa po normaliziranom upitu (kategorija, pretraga, korisnik).
+
+    Ukupan broj svih oglasa dolazi iz estimated_document_count() (metapodaci
+    kolekcije), a filtrirani brojevi se računaju jednom i vrijede do isteka TTL-a
+    ili do promjene oglasa koji utječe na njih.
+    """
+
+    def __init__(self, ttl=60, max_entries=4096):
+        self.cache = TTLCache(ttl, max_entries)
+        self.facet_cache = TTLCache(ttl, max_entries)
+
+    @staticmethod
+    def make_key(category=None, search=None, user_id=None):
+        """Normalizirani ključ upita"""
+        terms = ' '.join(sorted(set(analyze(search)))) if search else None
+        return (category or None, terms or None, str(user_id) if user_id else None)
+
+    def count(self, db, category=None, search=None, user_id=None, search_engine=None):
+        """Vraća broj oglasa za zadani upit (iz cachea ako je moguće)"""
+        key = self.make_key(category, search, user_id)
+        total = self.cache.get(key)
+        if total is not None:
+            return total
+        
+        query = {}
+        if category:
+            query['category'] = category
+        if user_id:
+            query['user_id'] = ObjectId(user_id)
+        
+        if key == (None, None, None):
+            total = db['ads'].estimated_document_count()
+        elif search:
+            total = search_engine.count(db, query, search)
+        else:
+            total = db['ads'].count_documents(query)
+        
+        self.cache.set(key, total)
+        return total
+
+    def facets(self, db, category=None, search=None, search_engine=None):
+        """Vraća facete (brojevi po kategorijama i cjenovni razredi) za listu oglasa"""
+        key = self.make_key(category, search)
+        facets = self.facet_cache.get(key)
+        if facets is None:
+            facets = get_facets(db, search_engine, search, category)
+            self.facet_cache.set(key, facets)
+        return facets
+
+    def invalidate(self, ad):
+        """Briše sve brojače na koje utječe zadani oglas"""
+        category = ad.get('category')
+        user_id = str(ad['user_id']) if ad.get('user_id') else None
+        self.cache.delete_where(
+            lambda key: key[0] in (None, category) and key[2] in (None, user_id)
+        )
+        # Faceti sadrže brojeve svih kategorija
+        self.facet_cache.clear()
+
+
+def invalidate_counts(sender, old=None, new=None, remote=False):
+    """ad_changed handler - briše brojače za stari i novi oblik oglasa"""
+    counter = sender.config['AD_COUNTER']
+    for ad in (old, new):
+        if ad:
+            counter.invalidate(ad)
@@ -0,0 +1,99 @@
+import atexit
+import os
+import threading
+from collections import Counter
+
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+
+class ViewCounter:
+    """Brojač pregleda oglasa skupljen u memoriji procesa.
+
+    Pregled samo povećava brojač u rječniku (bez upita bazi); pozadinska nit
+    svakih flush_interval sekundi - ili čim se skupi max_pending različitih
+    oglasa - upisuje sve brojače jednim neuređenim bulk_write ($inc views).
+    Preostali pregledi upisuju se i pri gašenju procesa. Nit se kreira lijeno
+    u svakom procesu, a neuspjeli upis vraća preglede u brojač za sljedeći pokušaj.
+    """
+
+    def __init__(self, app, flush_interval=5.0, max_pending=1000):
+        self.app = app
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._pending = Counter()
+        self._pid = None
+        self._thread = None
+        self._counters = {'views': 0, 'flushes': 0, 'views_flushed': 0, 'flush_failures': 0}
+
+    def start(self):
+        """Pokreće nit za upis (jednom po procesu; brojevi naslijeđeni preko fork-a se odbacuju)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pending = Counter()
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='view-counter', daemon=True)
+            self._thread.start()
+            if self._pid is None:
+                atexit.register(self.shutdown)
+            self._pid = os.getpid()
+
+    def hit(self, ad_id):
+        """Bilježi jedan pregled oglasa"""
+        self.start()
+        with self._lock:
+            self._pending[ad_id] += 1
+            self._counters['views'] += 1
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        """Upisuje skupljene preglede jednim bulk_write; vraća broj upisanih pregleda"""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        if not pending:
+            return 0
+        # Obrisani oglasi se preskaču (bez upserta)
+        requests = [UpdateOne({'_id': ad_id}, {'$inc': {'views': n}}) for ad_id, n in pending.items()]
+        try:
+            self.app.config['MONGO'].collection('ads').bulk_write(requests, ordered=False)
+        except PyMongoError as e:
+            with self._lock:
+                self._pending.update(pending)
+                self._counters['flush_failures'] += 1
+            self.app.logger.warning(f"Upis pregleda oglasa nije uspio ({len(pending)} oglasa): {e}")
+            return 0
+        total = sum(pending.values())
+        with self._lock:
+            self._counters['flushes'] += 1
+            self._counters['views_flushed'] += total
+        return total
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['pending_ads'] = len(self._pending)
+        return stats
+
+    def shutdown(self):
+        """Zaustavlja nit i upisuje preostale preglede"""
+        if self._pid != os.getpid():
+            return
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(self.flush_interval)
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
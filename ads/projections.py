@@ -0,0 +1,19 @@
+# Projekcije oglasa po vrsti prikaza - svaki prikaz dohvaća samo polja koja koristi
+
+# Kartica u listi oglasa (ads.ads, ads.my_ads, main.index) - bez opisa, s gotovim izvatkom
+CARD_PROJECTION = {
+    'title': 1, 'excerpt_html': 1, 'description_html_version': 1, 'seller': 1, 'cellNo': 1,
+    'price': 1, 'category': 1, 'location': 1, 'created_at': 1, 'image_id': 1, 'views': 1
+}
+
+# Stranica s detaljima - sve osim pomoćnih polja za pretragu i kartice
+DETAIL_PROJECTION = {'search': 0, 'excerpt_html': 0}
+
+# Uređivanje oglasa (forma + provjera vlasnika + invalidacija)
+OWNER_EDIT_PROJECTION = {
+    'title': 1, 'description': 1, 'price': 1, 'category': 1, 'location': 1, 'created_at': 1,
+    'user_id': 1, 'image_id': 1, 'image_variants': 1
+}
+
+# Brisanje oglasa (provjera vlasnika, slika, invalidacija i ažuriranje brojača)
+OWNER_DELETE_PROJECTION = {'user_id': 1, 'image_id': 1, 'category': 1, 'price': 1}
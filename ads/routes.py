@@ -1,20 +1,82 @@
 from bson import ObjectId
-from flask import render_template, request, flash, redirect, url_for, Response, current_app, abort
+from bson.errors import InvalidId
+from flask import render_template, request, flash, redirect, url_for, current_app, abort
+from gridfs.errors import NoFile
 from datetime import datetime
 
 from flask_login import current_user, login_required
+from pymongo import ASCENDING, DESCENDING
 
 from .forms import AdForm, EditAdForm
 from . import bp
-from ..utils import get_pagination_info, get_pagination_range
+from ..utils import (get_pagination_info, get_pagination_range, encode_cursor, decode_cursor, keyset_filter,
+                     render_description_fields, get_description_html, ensure_excerpts, RENDERER_VERSION)
+from .projections import CARD_PROJECTION, DETAIL_PROJECTION, OWNER_EDIT_PROJECTION, OWNER_DELETE_PROJECTION
+from ..search import build_search_fields
+from ..signals import ad_changed
+from ..cache import cached_page, not_modified, page_etag, with_validators
+from ..images import (AD_IMAGE_VARIANTS, CachedImage, ImageUploadError, store_image, delete_image, open_image, image_cache_key,
+                      image_not_modified, send_grid_file, send_cached_image)
+
+# Redoslijed liste oglasa (parametar sort) -> polje za keyset paginaciju
+SORT_FIELDS = {
+    'newest': 'created_at',
+    'popular': 'views',
+}
+
+def _fetch_page(collection, query, page, per_page, total, sort_field='created_at', projection=CARD_PROJECTION):
+    """Dohvaća jednu stranicu oglasa i paginacijske podatke.
+
+    Stranice se dohvaćaju keyset paginacijom po (sort_field, _id) preko
+    after/before tokena. Bez tokena se koristi skip, ali najviše do
+    PAGINATION_MAX_OFFSET_PAGES, pa je cijena svake stranice ograničena.
+    """
+    max_offset_pages = current_app.config['PAGINATION_MAX_OFFSET_PAGES']
+    after = decode_cursor(request.args.get('after', ''))
+    before = decode_cursor(request.args.get('before', ''))
+    
+    if before:
+        # Prethodna stranica: idemo uzlazno od tokena pa okrećemo redoslijed
+        cursor_query = {**query, **keyset_filter(*before, sort_field=sort_field, before=True)}
+        docs = list(collection.find(cursor_query, projection)
+                    .sort([(sort_field, ASCENDING), ('_id', ASCENDING)])
+                    .limit(per_page + 1))
+        if len(docs) <= per_page:
+            page = 1  # Nema ničeg prije - ovo je prva stranica
+        docs = docs[:per_page][::-1]
+        has_next = True
+    else:
+        cursor = collection.find({**query, **keyset_filter(*after, sort_field=sort_field)} if after else query,
+                                 projection)
+        cursor = cursor.sort([(sort_field, DESCENDING), ('_id', DESCENDING)])
+        if not after:
+            page = min(page, max_offset_pages)
+            cursor = cursor.skip((page - 1) * per_page)
+        docs = list(cursor.limit(per_page + 1))
+        has_next = len(docs) > per_page
+        docs = docs[:per_page]
+    ensure_excerpts(docs, collection)
+    
+    # Na prvu stranicu vodi običan link bez tokena
+    prev_cursor = encode_cursor(docs[0], sort_field) if docs and page > 2 else None
+    next_cursor = encode_cursor(docs[-1], sort_field) if docs and has_next else None
+    
+    pagination = get_pagination_info(page, per_page, total, has_next=has_next,
+                                     prev_cursor=prev_cursor, next_cursor=next_cursor)
+    pagination['pages'] = get_pagination_range(page, pagination['total_pages'], max_page=max_offset_pages)
+    return docs, pagination
 
 @bp.route('/')
+@cached_page
 def ads():
     """Lista svih oglasa s paginacijom i pretragom"""
     ads_collection = current_app.config['ADS_COLLECTION']
     category = request.args.get('category', '')
     search = request.args.get('search', '').strip()
-    page = int(request.args.get('page', 1))
+    sort = request.args.get('sort', 'newest')
+    if sort not in SORT_FIELDS:
+        sort = 'newest'
+    page = max(1, int(request.args.get('page', 1)))
     per_page = 12  # 3x4 grid
     
     # Izgradi query
@@ -24,27 +86,49 @@ def ads():
     if category:
         query['category'] = category
     
-    # Dodaj search filter
-    if search:
-        query['title'] = {'$regex': search, '$options': 'i'}  # Case-insensitive search
-    
-    # Izračunaj ukupan broj oglasa
-    total = ads_collection.count_documents(query)
+    # Ukupan broj oglasa (keširan po kategoriji/pretrazi)
+    db = current_app.config['DB']
+    search_engine = current_app.config['SEARCH_ENGINE']
+    total = current_app.config['AD_COUNTER'].count(db, category=category, search=search,
+                                                   search_engine=search_engine)
     
-    # Dohvati oglase s paginacijom
-    skip = (page - 1) * per_page
-    ads = ads_collection.find(query).sort('created_at', -1).skip(skip).limit(per_page)
+    # Validator liste: najnoviji updated_at za upit + broj oglasa (mijenja se i pri brisanju).
+    # Redoslijed po pregledima se mijenja bez promjene oglasa pa nema validator
+    etag = None
+    if not search and sort == 'newest':
+        latest = ads_collection.find_one(query, {'updated_at': 1, '_id': 0}, sort=[('updated_at', DESCENDING)])
+        etag = page_etag(request.full_path, latest and latest.get('updated_at'), total, RENDERER_VERSION)
+        response = not_modified(etag)
+        if response is not None:
+            return response
     
-    # Generiraj paginacijske podatke
-    pagination = get_pagination_info(page, per_page, total)
-    pagination['pages'] = get_pagination_range(page, pagination['total_pages'])
+    if search:
+        # Rezultati pretrage sortirani su po relevantnosti pa koriste (ograničenu) offset paginaciju
+        max_offset_pages = current_app.config['PAGINATION_MAX_OFFSET_PAGES']
+        page = min(page, max_offset_pages)
+        ads = search_engine.search(db, query, search, (page - 1) * per_page, per_page, CARD_PROJECTION)
+        ensure_excerpts(ads, ads_collection)
+        pagination = get_pagination_info(page, per_page, total)
+        pagination['has_next'] = pagination['has_next'] and page < max_offset_pages
+        pagination['next_num'] = page + 1 if pagination['has_next'] else None
+        pagination['pages'] = get_pagination_range(page, pagination['total_pages'], max_page=max_offset_pages)
+    else:
+        # Dohvati oglase s paginacijom i generiraj paginacijske podatke
+        ads, pagination = _fetch_page(ads_collection, query, page, per_page, total, sort_field=SORT_FIELDS[sort])
 
     print(pagination)
     
-    return render_template('ads.html', 
+    # Brojevi po kategorijama i cjenovni razredi za filtere
+    facets = current_app.config['AD_COUNTER'].facets(db, category=category, search=search,
+                                                     search_engine=search_engine)
+    
+    response = render_template('ads.html', 
                          ads=ads, 
                          selected_category=category,
-                         pagination=pagination)
+                         pagination=pagination,
+                         facets=facets,
+                         selected_sort=sort if sort != 'newest' else None)
+    return with_validators(response, etag) if etag else response
 
 @bp.route('/new', methods=['GET', 'POST'])
 @login_required
@@ -65,21 +149,27 @@ def new_ad():
             'location': form.location.data or '',
             'image_id': None,
             'created_at': datetime.now(),
-            'user_id': ObjectId(current_user.id)
+            'user_id': ObjectId(current_user.id),
+            'views': 0
         }
+        new_ad['updated_at'] = new_ad['created_at']
         
-        # Upload slike u GridFS
+        # Upload slike (i umanjenih varijanti) u GridFS
         if form.image.data:
-            file = form.image.data
-            image_id = fs.put(
-                file.read(),
-                filename=file.filename,
-                content_type=file.content_type
-            )
+            try:
+                image_id, variants = store_image(current_app.config['DB'], fs, form.image.data, AD_IMAGE_VARIANTS)
+            except ImageUploadError as e:
+                flash(str(e), 'danger')
+                return render_template('new_ad.html', form=form)
             new_ad['image_id'] = image_id
+            new_ad['image_variants'] = variants
         
-        # Spremi oglas u MongoDB
+        # Spremi oglas u MongoDB (zajedno s renderiranim opisom i poljima za pretragu)
+        new_ad.update(render_description_fields(new_ad['description']))
+        new_ad['search'] = build_search_fields(new_ad)
         ads_collection.insert_one(new_ad)
+        current_app.config['SEARCH_ENGINE'].index_ad(current_app.config['DB'], new_ad)
+        ad_changed.send(current_app._get_current_object(), old=None, new=new_ad)
     
         flash('Oglas je uspješno kreiran!', 'success')
         return redirect(url_for('ads.ads'))
@@ -91,26 +181,36 @@ def new_ad():
 def my_ads():
     """Moji oglasi (oglasi prijavljenog korisnika)"""
     ads_collection = current_app.config['ADS_COLLECTION']
-    page = int(request.args.get('page', 1))
+    page = max(1, int(request.args.get('page', 1)))
     per_page = 12
     query = {'user_id': ObjectId(current_user.id)}
-    total = ads_collection.count_documents(query)
-    skip = (page - 1) * per_page
-    ads = ads_collection.find(query).sort('created_at', -1).skip(skip).limit(per_page)
-    pagination = get_pagination_info(page, per_page, total)
-    pagination['pages'] = get_pagination_range(page, pagination['total_pages'])
+    total = current_app.config['AD_COUNTER'].count(current_app.config['DB'], user_id=current_user.id)
+    ads, pagination = _fetch_page(ads_collection, query, page, per_page, total)
     return render_template('ads.html', ads=ads, selected_category=request.args.get('category',''), pagination=pagination, my_view=True)
 
 @bp.route('/<ad_id>')
 def ad_detail(ad_id):
     """Detalji oglasa"""
     ads_collection = current_app.config['ADS_COLLECTION']
-    ad = ads_collection.find_one({'_id': ObjectId(ad_id)})
+    ad = ads_collection.find_one({'_id': ObjectId(ad_id)}, DETAIL_PROJECTION)
     
     if not ad:
         abort(404)
     
-    return render_template('ad_detail.html', ad=ad)
+    # Pregled se samo broji u memoriji; u bazu ide skupno (ViewCounter)
+    current_app.config['VIEW_COUNTER'].hit(ad['_id'])
+    
+    # Anonimni klijent koji već ima trenutnu verziju dobiva 304 bez renderiranja
+    updated_at = ad.get('updated_at') or ad.get('created_at')
+    etag = page_etag(ad['_id'], updated_at, ad.get('description_html_version'), RENDERER_VERSION)
+    response = not_modified(etag, updated_at)
+    if response is not None:
+        return response
+    
+    # Opis je renderiran pri spremanju; stari oglasi se renderiraju i spremaju sada
+    ad['description_html'] = get_description_html(ad, ads_collection)
+    
+    return with_validators(render_template('ad_detail.html', ad=ad), etag, updated_at)
 
 @bp.route('/<ad_id>/edit', methods=['GET', 'POST'])
 @login_required
@@ -118,7 +218,7 @@ def edit_ad(ad_id):
     """Uređivanje oglasa"""
     ads_collection = current_app.config['ADS_COLLECTION']
     fs = current_app.config['GRIDFS']
-    ad = ads_collection.find_one({'_id': ObjectId(ad_id)})
+    ad = ads_collection.find_one({'_id': ObjectId(ad_id)}, OWNER_EDIT_PROJECTION)
     
     if not ad:
         abort(404)
@@ -137,32 +237,38 @@ def edit_ad(ad_id):
             'price': float(form.price.data),
             'category': form.category.data,
             'location': form.location.data or '',
-            'created_at': ad['created_at']  # Zadržavamo originalni datum
+            'created_at': ad['created_at'],  # Zadržavamo originalni datum
+            'updated_at': datetime.now()
         }
         
         # Ako je uploadana nova slika
         if form.image.data:
-            # Obriši staru sliku iz GridFS
-            if ad.get('image_id'):
-                fs.delete(ad['image_id'])
-            
             # Spremi novu sliku u GridFS
-            file = form.image.data
-            image_id = fs.put(
-                file.read(),
-                filename=file.filename,
-                content_type=file.content_type
-            )
+            try:
+                image_id, variants = store_image(current_app.config['DB'], fs, form.image.data, AD_IMAGE_VARIANTS)
+            except ImageUploadError as e:
+                flash(str(e), 'danger')
+                return render_template('edit_ad.html', form=form, ad=ad)
             updated_ad['image_id'] = image_id
+            updated_ad['image_variants'] = variants
+            
+            # Obriši staru sliku (i njezine varijante) iz GridFS
+            if ad.get('image_id'):
+                delete_image(fs, ad['image_id'])
         else:
             # Zadrži postojeću sliku
             updated_ad['image_id'] = ad.get('image_id')
+            updated_ad['image_variants'] = ad.get('image_variants', {})
         
         # Ažuriraj oglas u MongoDB
+        updated_ad.update(render_description_fields(updated_ad['description']))
+        updated_ad['search'] = build_search_fields(updated_ad)
         ads_collection.update_one(
             {'_id': ObjectId(ad_id)},
             {'$set': updated_ad}
         )
+        current_app.config['SEARCH_ENGINE'].index_ad(current_app.config['DB'], {**ad, **updated_ad})
+        ad_changed.send(current_app._get_current_object(), old=ad, new={**ad, **updated_ad})
         
         flash('Oglas je uspješno ažuriran!', 'success')
         return redirect(url_for('ads.ad_detail', ad_id=ad_id))
@@ -179,14 +285,39 @@ def edit_ad(ad_id):
 
 @bp.route('/image/<image_id>')
 def get_image(image_id):
-    """Serviranje slike iz GridFS"""
+    """Serviranje slike iz GridFS (stream, Range i uvjetni GET).
+
+    Parametar size (card, detail, avatar) odabire umanjenu varijantu, a WebP
+    se šalje klijentima koji ga navode u Accept zaglavlju.
+    """
     fs = current_app.config['GRIDFS']
+    cache = current_app.config['IMAGE_CACHE']
+    size = request.args.get('size')
+    
+    # Česte slike poslužuju se iz memorije bez upita bazi
+    cache_key = image_cache_key(image_id, size)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return send_cached_image(cached, vary_accept=bool(size))
+    
     try:
-        image = fs.get(ObjectId(image_id))
-        return Response(image.read(), mimetype=image.content_type)
-    except:
+        # Dohvaća samo fs.files dokumente; chunkovi se čitaju tek pri slanju
+        image = open_image(fs, ObjectId(image_id), size)
+    except (InvalidId, NoFile):
         # Ako slika ne postoji, vrati 404
         abort(404)
+    
+    # Uvjetni GET (If-None-Match ili If-Modified-Since) se odlučuje bez čitanja chunkova
+    response = image_not_modified(image, vary_accept=bool(size))
+    if response is not None:
+        return response
+    
+    # U cache ide samo slika koja se stvarno šalje (200/206); prevelike slike se samo streamaju
+    if cache.accepts(image.length):
+        cached = CachedImage(image)
+        cache.set(cache_key, cached, cached.length)
+        return send_cached_image(cached, vary_accept=bool(size))
+    return send_grid_file(image, vary_accept=bool(size))
 
 @bp.route('/<ad_id>/delete', methods=['POST'])
 @login_required
@@ -194,7 +325,7 @@ def delete_ad(ad_id):
     """Brisanje oglasa"""
     ads_collection = current_app.config['ADS_COLLECTION']
     fs = current_app.config['GRIDFS']
-    ad = ads_collection.find_one({'_id': ObjectId(ad_id)})
+    ad = ads_collection.find_one({'_id': ObjectId(ad_id)}, OWNER_DELETE_PROJECTION)
     
     if not ad:
         abort(404)
@@ -203,15 +334,17 @@ def delete_ad(ad_id):
     if ad.get('user_id') and str(ad.get('user_id')) != str(current_user.id):
         abort(403)
 
-    # Obriši sliku iz GridFS ako postoji
+    # Obriši sliku (i njezine varijante) iz GridFS ako postoji
     if ad.get('image_id'):
         try:
-            fs.delete(ad['image_id'])
+            delete_image(fs, ad['image_id'])
         except:
             pass  # Ako slika ne postoji, nastavi
     
     # Obriši oglas
     ads_collection.delete_one({'_id': ObjectId(ad_id)})
+    current_app.config['SEARCH_ENGINE'].remove_ad(current_app.config['DB'], ad['_id'])
+    ad_changed.send(current_app._get_current_object(), old=ad, new=None)
     
     flash('Oglas je uspješno obrisan!', 'success')
     return redirect(url_for('ads.ads'))
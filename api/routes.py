@@ -0,0 +1,128 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from flask import Response, current_app, jsonify, request
+
+from . import bp
+from ..indexes import SYNC_SORT
+from ..utils import decode_cursor, encode_cursor, keyset_filter
+
+# Polja oglasa u izvozu (redoslijed je ujedno redoslijed CSV stupaca)
+EXPORT_FIELDS = ['_id', 'title', 'description', 'price', 'category', 'location', 'seller', 'cellNo',
+                 'image_id', 'created_at', 'updated_at']
+EXPORT_PROJECTION = {field: 1 for field in EXPORT_FIELDS}
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def _parse_datetime(value, name):
+    """ISO datum (2024-05-01) ili datum i vrijeme (2024-05-01T12:00:00); ValueError s nazivom parametra"""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Neispravan datum u parametru {name}: {value}")
+
+
+def _build_query(args, overlap_seconds=0):
+    """Filter izvoza iz parametara zahtjeva (kategorija, raspon created_at, watermark).
+
+    updated_since se pomiče overlap_seconds unatrag: updated_at se postavlja u
+    web radniku prije upisa, pa oglas s updated_at malo prije watermarka može
+    postati vidljiv tek nakon što je partner već sinkronizirao do njega.
+    """
+    query = {}
+    if args.get('category'):
+        query['category'] = args['category']
+
+    created = {}
+    if args.get('created_from'):
+        created['$gte'] = _parse_datetime(args['created_from'], 'created_from')
+    if args.get('created_to'):
+        created['$lt'] = _parse_datetime(args['created_to'], 'created_to')
+    if created:
+        query['created_at'] = created
+
+    if args.get('after'):
+        # Nastavak od zadnjeg primljenog zapisa (vrijednost stupca cursor)
+        position = decode_cursor(args['after'])
+        if position is None:
+            raise ValueError('Neispravan parametar after')
+        query.update(keyset_filter(*position, sort_field='updated_at', before=True))
+    elif args.get('updated_since'):
+        since = _parse_datetime(args['updated_since'], 'updated_since')
+        query['updated_at'] = {'$gte': since - timedelta(seconds=overlap_seconds)}
+    else:
+        # Oglasi bez updated_at (prije uvođenja polja) nemaju poziciju u izvozu
+        query['updated_at'] = {'$type': 'date'}
+    return query
+
+
+def _export_value(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _export_record(ad):
+    """Zapis za izvoz: polja oglasa + cursor za nastavak nakon ovog zapisa"""
+    record = {field: _export_value(ad.get(field)) for field in EXPORT_FIELDS}
+    record['cursor'] = encode_cursor(ad, 'updated_at')
+    return record
+
+
+def _ndjson_lines(cursor):
+    for ad in cursor:
+        yield json.dumps(_export_record(ad), ensure_ascii=False) + '\n'
+
+
+def _csv_lines(cursor):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS + ['cursor'])
+    for ad in cursor:
+        record = _export_record(ad)
+        writer.writerow([record[field] for field in EXPORT_FIELDS] + [record['cursor']])
+        # Svaki redak se šalje odmah - u memoriji je samo trenutni batch cursora
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+@bp.route('/ads')
+def export_ads():
+    """Izvoz oglasa kao NDJSON ili CSV stream, sortirano uzlazno po (updated_at, _id).
+
+    Inkrementalna sinkronizacija: svaka nova sinkronizacija šalje updated_at
+    zadnjeg primljenog zapisa kao updated_since - izvoz tada kreće API_SYNC_OVERLAP_SECONDS
+    ranije, pa partner dio oglasa primi ponovno i sprema ih po _id (upsert).
+    Prekinuti prijenos ili sljedeća stranica (limit) nastavlja se bez preklapanja,
+    cursorom zadnjeg potpuno primljenog retka kao after.
+    """
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify(error=f"Nepodržan format: {export_format} (ndjson ili csv)"), 400
+    try:
+        query = _build_query(request.args, current_app.config['API_SYNC_OVERLAP_SECONDS'])
+        limit = max(0, int(request.args.get('limit', 0)))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    cursor = current_app.config['ADS_COLLECTION'].find(
+        query, EXPORT_PROJECTION,
+        sort=SYNC_SORT,
+        limit=limit,
+        batch_size=current_app.config['API_BATCH_SIZE']
+    )
+    lines = _csv_lines(cursor) if export_format == 'csv' else _ndjson_lines(cursor)
+    response = Response(lines, mimetype=EXPORT_FORMATS[export_format])
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    response.cache_control.no_store = True
+    return response
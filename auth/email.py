@@ -1,16 +1,8 @@
 from flask import render_template, url_for, current_app
 from flask_mail import Message
-from threading import Thread
-
-def send_async_email(app, msg):
-    """Šalje email asinkrono u novom threadu"""
-    with app.app_context():
-        mail = current_app.extensions['mail']
-        mail.send(msg)
 
 def send_verification_email(user):
-    """Šalje email za verifikaciju email adrese"""
-    app = current_app._get_current_object()
+    """Šalje email za verifikaciju email adrese (preko reda EMAIL_DISPATCHER)"""
     mail = current_app.extensions.get('mail')
     
     # Generiraj verifikacijski token (traje 1 sat)
@@ -35,9 +27,10 @@ def send_verification_email(user):
                            verify_url=verify_url)
     )
     
-    # Pošalji email asinkrono
-    thr = Thread(target=send_async_email, args=[app, msg])
-    thr.start()
+    # Pošalji email asinkrono (radnici s otvorenim SMTP vezama)
+    queued = current_app.config['EMAIL_DISPATCHER'].submit(msg)
+    if not queued:
+        current_app.logger.warning(f"Red za slanje emailova je pun - verifikacijski email za {user.email} nije poslan")
     
-    return thr
+    return queued
 
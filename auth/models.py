@@ -1,24 +1,75 @@
 from flask import current_app
-from flask_login import UserMixin
-from werkzeug.security import check_password_hash, generate_password_hash
 from itsdangerous import URLSafeTimedSerializer, SignatureExpired, BadSignature
 from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from .passwords import PasswordHashingUnavailable
+from ..invalidation import publish_invalidation
 
-class User(UserMixin):
-    """User model za Flask-Login i MongoDB"""
+# Polja potrebna za obradu zahtjeva prijavljenog korisnika (bez password_hash)
+SESSION_PROJECTION = {
+    'username': 1, 'email': 1, 'email_verified': 1, 'first_name': 1, 'last_name': 1,
+    'phone': 1, 'profile_image_id': 1, 'profile_image_variants': 1
+}
+
+# Poruke za povredu jedinstvenih indeksa (username_unique, email_unique) po polju
+DUPLICATE_MESSAGES = {
+    'username': 'Korisničko ime već postoji',
+    'email': 'Email adresa već postoji',
+}
+
+
+def _duplicate_message(error):
+    """Poruka za DuplicateKeyError prema polju jedinstvenog indeksa koji je povrijeđen"""
+    fields = (error.details or {}).get('keyPattern') or {}
+    for field, message in DUPLICATE_MESSAGES.items():
+        if field in fields or f'{field}_unique' in str(error):
+            return message
+    return 'Korisnik već postoji'
+
+class User:
+    """User model za Flask-Login i MongoDB.
+
+    Umjesto UserMixin (koji nema __slots__) sučelje za Flask-Login je
+    implementirano ovdje, pa objekt nema __dict__.
+    """
+    
+    __slots__ = ('id', 'username', 'email', 'password_hash', 'email_verified', 'first_name',
+                 'last_name', 'phone', 'profile_image_id', 'profile_image_variants')
     
     def __init__(self, user_data):
         """Inicijalizira User objekt iz MongoDB dokumenta"""
+        self._load(user_data)
+    
+    def _load(self, user_data):
         self.id = str(user_data['_id'])
         self.username = user_data['username']
         self.email = user_data.get('email', '')
-        self.password_hash = user_data['password_hash']
+        # Nema ga kad je korisnik učitan sa SESSION_PROJECTION
+        self.password_hash = user_data.get('password_hash')
         self.email_verified = user_data.get('email_verified', False)
         # Profil podaci
         self.first_name = user_data.get('first_name', '')
         self.last_name = user_data.get('last_name', '')
         self.phone = user_data.get('phone', '')
         self.profile_image_id = user_data.get('profile_image_id')
+        self.profile_image_variants = user_data.get('profile_image_variants', {})
+    
+    # Flask-Login sučelje
+    is_active = True
+    is_authenticated = True
+    is_anonymous = False
+    
+    def get_id(self):
+        return self.id
+    
+    def __eq__(self, other):
+        if isinstance(other, User):
+            return self.id == other.id
+        return NotImplemented
+    
+    def __hash__(self):
+        return hash(self.id)
     
     @staticmethod
     def _get_collection():
@@ -31,17 +82,49 @@ class User(UserMixin):
         secret_key = current_app.config['SECRET_KEY']
         return URLSafeTimedSerializer(secret_key)
     
+    @staticmethod
+    def _get_hasher():
+        """PasswordHasher (pool procesa za hashiranje lozinki)"""
+        return current_app.config['PASSWORD_HASHER']
+    
+    @staticmethod
+    def _get_cache():
+        """Cache korisnika po ID-u (za user_loader) ili None ako nije konfiguriran"""
+        return current_app.config.get('USER_CACHE')
+    
+    @staticmethod
+    def invalidate(user_id):
+        """Briše korisnika iz cachea nakon promjene njegovog dokumenta (i u ostalim procesima)"""
+        cache = User._get_cache()
+        if cache is not None:
+            cache.delete(str(user_id))
+        publish_invalidation('user', user_id)
+    
+    @staticmethod
+    def _cache_fresh(user_data):
+        """Sprema dokument (SESSION_PROJECTION) vraćen iz find_one_and_update u cache korisnika"""
+        cache = User._get_cache()
+        if cache is not None:
+            cache.set(str(user_data['_id']), user_data)
+        # Ostali procesi ga brišu i učitavaju iz baze pri sljedećem zahtjevu
+        publish_invalidation('user', user_data['_id'])
+    
     @staticmethod
     def get_by_id(user_id):
-        """Dohvaća korisnika po ID-u"""
-        try:
-            users_collection = User._get_collection()
-            user_data = users_collection.find_one({'_id': ObjectId(user_id)})
-            if user_data:
-                return User(user_data)
-        except:
-            pass
-        return None
+        """Dohvaća korisnika po ID-u (bez password_hash, iz cachea ako je moguće)"""
+        cache = User._get_cache()
+        user_data = cache.get(str(user_id)) if cache is not None else None
+        if user_data is None:
+            try:
+                users_collection = User._get_collection()
+                user_data = users_collection.find_one({'_id': ObjectId(user_id)}, SESSION_PROJECTION)
+            except:
+                user_data = None
+            if not user_data:
+                return None
+            if cache is not None:
+                cache.set(str(user_id), user_data)
+        return User(user_data)
     
     @staticmethod
     def get_by_username(username):
@@ -63,18 +146,22 @@ class User(UserMixin):
     
     @staticmethod
     def create(username, email, password):
-        """Kreira novog korisnika"""
+        """Kreira novog korisnika jednim insertom.
+
+        Zauzeto korisničko ime ili email odbija se jeftinim upitom prije
+        (skupog) hashiranja lozinke; jedinstveni indeks ostaje konačna provjera
+        (ValueError s porukom), pa istovremene registracije istog imena ne mogu
+        obje uspjeti.
+        """
         users_collection = User._get_collection()
         
-        # Provjeri da li korisnik već postoji
-        if users_collection.find_one({'username': username}):
-            raise ValueError('Korisničko ime već postoji')
+        existing = users_collection.find_one({'$or': [{'username': username}, {'email': email}]},
+                                             {'username': 1})
+        if existing is not None:
+            field = 'username' if existing.get('username') == username else 'email'
+            raise ValueError(DUPLICATE_MESSAGES[field])
         
-        if users_collection.find_one({'email': email}):
-            raise ValueError('Email adresa već postoji')
-        
-        # Kreiraj novog korisnika
-        password_hash = generate_password_hash(password)
+        password_hash = User._get_hasher().hash(password)
         user_data = {
             'username': username,
             'email': email,
@@ -83,10 +170,14 @@ class User(UserMixin):
             'first_name': '',
             'last_name': '',
             'phone': '',
-            'profile_image_id': None
+            'profile_image_id': None,
+            'profile_image_variants': {}
         }
         
-        result = users_collection.insert_one(user_data)
+        try:
+            result = users_collection.insert_one(user_data)
+        except DuplicateKeyError as e:
+            raise ValueError(_duplicate_message(e))
         user_data['_id'] = result.inserted_id
         return User(user_data)
     
@@ -104,30 +195,30 @@ class User(UserMixin):
         except BadSignature:
             return None, 'Nevažeći verifikacijski token'
         
-        # Dohvati korisnika
         try:
-            user_data = users_collection.find_one({'_id': ObjectId(user_id)})
-        except:
-            return None, 'Nevažeći verifikacijski token'
-        
-        if not user_data:
+            user_id = ObjectId(user_id)
+        except Exception:
             return None, 'Nevažeći verifikacijski token'
         
-        if user_data.get('email_verified', False):
-            return None, 'Email adresa je već verificirana'
-        
-        # Ažuriraj korisnika kao verificiranog
-        users_collection.update_one(
-            {'_id': user_data['_id']},
-            {'$set': {'email_verified': True}}
+        # Označi kao verificiranog samo ako već nije (uvjet u filteru) i vrati ažurirani dokument
+        user_data = users_collection.find_one_and_update(
+            {'_id': user_id, 'email_verified': {'$ne': True}},
+            {'$set': {'email_verified': True}},
+            projection=SESSION_PROJECTION,
+            return_document=ReturnDocument.AFTER
         )
+        if user_data:
+            User._cache_fresh(user_data)
+            return User(user_data), None
         
-        # Dohvati ažurirani dokument
-        updated_user_data = users_collection.find_one({'_id': user_data['_id']})
-        return User(updated_user_data), None
+        # Ništa nije ažurirano - drugi upit samo za poruku o grešci
+        if users_collection.find_one({'_id': user_id}, {'_id': 1}):
+            return None, 'Email adresa je već verificirana'
+        return None, 'Nevažeći verifikacijski token'
     
-    def update_profile(self, first_name: str, last_name: str, phone: str, profile_image_id=None):
-        """Ažurira profilne podatke korisnika."""
+    def update_profile(self, first_name: str, last_name: str, phone: str, profile_image_id=None,
+                       profile_image_variants=None):
+        """Ažurira profilne podatke korisnika (lokalna polja i cache iz ažuriranog dokumenta)."""
         users_collection = User._get_collection()
         update_fields = {
             'first_name': first_name or '',
@@ -136,13 +227,22 @@ class User(UserMixin):
         }
         if profile_image_id is not None:
             update_fields['profile_image_id'] = profile_image_id
-        users_collection.update_one({'_id': ObjectId(self.id)}, {'$set': update_fields})
-        # Osvježi lokalna polja
-        self.first_name = update_fields['first_name']
-        self.last_name = update_fields['last_name']
-        self.phone = update_fields['phone']
-        if 'profile_image_id' in update_fields:
-            self.profile_image_id = update_fields['profile_image_id']
+        if profile_image_variants is not None:
+            update_fields['profile_image_variants'] = profile_image_variants
+        user_data = users_collection.find_one_and_update(
+            {'_id': ObjectId(self.id)},
+            {'$set': update_fields},
+            projection=SESSION_PROJECTION,
+            return_document=ReturnDocument.AFTER
+        )
+        if not user_data:
+            # Korisnik je u međuvremenu obrisan
+            User.invalidate(self.id)
+            return
+        User._cache_fresh(user_data)
+        password_hash = self.password_hash
+        self._load(user_data)
+        self.password_hash = password_hash
 
     def generate_verification_token(self):
         """Generira verifikacijski token koji traje 1 sat"""
@@ -151,6 +251,27 @@ class User(UserMixin):
         return serializer.dumps(self.id)
     
     def check_password(self, password):
-        """Provjeri lozinku"""
-        return check_password_hash(self.password_hash, password)
+        """Provjeri lozinku (u poolu za hashiranje, može podići PasswordHashingUnavailable).
+
+        Hash kreiran drugom metodom ili parametrima od PASSWORD_HASH_METHOD
+        zamjenjuje se novim pri uspješnoj provjeri (jedino tada je lozinka poznata).
+        """
+        if not self.password_hash:
+            return False
+        hasher = User._get_hasher()
+        if not hasher.verify(self.password_hash, password):
+            return False
+        try:
+            new_hash = hasher.upgrade(self.password_hash, password)
+        except PasswordHashingUnavailable:
+            # Lozinka je ispravna - nadogradnja hasha čeka sljedeću prijavu
+            new_hash = None
+        if new_hash:
+            # Uvjet na stari hash: istovremena promjena lozinke se ne prepisuje
+            User._get_collection().update_one(
+                {'_id': ObjectId(self.id), 'password_hash': self.password_hash},
+                {'$set': {'password_hash': new_hash}}
+            )
+            self.password_hash = new_hash
+        return True
 
@@ -0,0 +1,133 @@
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class PasswordHashingUnavailable(RuntimeError):
+    """Pool za hashiranje je pun, nije odgovorio na vrijeme ili je pao"""
+
+
+class PasswordHasher:
+    """Hashiranje i provjera lozinki u ograničenom poolu procesa.
+
+    KDF (scrypt/pbkdf2) je namjerno spor, pa se ne izvršava u niti zahtjeva:
+    najviše workers procesa hashira istovremeno, a najviše queue_size poziva
+    čeka ili se izvršava - sve iznad toga (i poziv koji traje dulje od timeout
+    sekundi) odmah završava s PasswordHashingUnavailable, umjesto da zauzme
+    sve radnike aplikacije. Pool se kreira lijeno, zasebno u svakom procesu
+    (kao MongoConnection), s 'spawn' procesima koji ne nasljeđuju niti i
+    konekcije roditelja. workers=0 hashira u niti poziva (razvoj, CLI).
+    """
+
+    def __init__(self, method='scrypt', workers=2, queue_size=16, timeout=5.0):
+        self.method = method
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._pid = None
+        self._executor = None
+        self._method_prefix = None
+        self._counters = {'hashed': 0, 'verified': 0, 'rejected': 0, 'timeouts': 0, 'rehashed': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # Pool naslijeđen preko fork-a ne pripada ovom procesu
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+                if self._pid is None:
+                    atexit.register(self.shutdown)
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, func, *args):
+        if self.workers <= 0:
+            return func(*args)
+        with self._lock:
+            if self._in_flight >= self.queue_size:
+                self._counters['rejected'] += 1
+                raise PasswordHashingUnavailable('Previše istovremenih provjera lozinki')
+            self._in_flight += 1
+        try:
+            future = self._get_executor().submit(func, *args)
+        except (BrokenProcessPool, RuntimeError):
+            self._release()
+            self._reset()
+            raise PasswordHashingUnavailable('Pool za hashiranje lozinki nije dostupan')
+        # Mjesto se oslobađa tek kad proces završi, pa i poziv koji je istekao ostaje u limitu
+        future.add_done_callback(lambda _: self._release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            self._count('timeouts')
+            raise PasswordHashingUnavailable('Provjera lozinke nije završila na vrijeme')
+        except BrokenProcessPool:
+            self._reset()
+            raise PasswordHashingUnavailable('Pool za hashiranje lozinki je pao')
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _reset(self):
+        """Odbacuje pokvareni pool (sljedeći poziv kreira novi)"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def hash(self, password):
+        """Hash lozinke konfiguriranom metodom"""
+        password_hash = self._run(generate_password_hash, password, self.method)
+        self._count('hashed')
+        return password_hash
+
+    def verify(self, password_hash, password):
+        """Provjerava lozinku prema spremljenom hashu"""
+        valid = self._run(check_password_hash, password_hash, password)
+        self._count('verified')
+        return valid
+
+    def needs_rehash(self, password_hash):
+        """Je li hash kreiran drugom metodom ili parametrima od konfiguriranih"""
+        if self._method_prefix is None:
+            # Werkzeug nadopunjuje zadane parametre (scrypt -> scrypt:32768:8:1), pa se prefiks
+            # uzima iz stvarnog hasha
+            self._method_prefix = self.hash('').split('$', 1)[0]
+        return password_hash.split('$', 1)[0] != self._method_prefix
+
+    def upgrade(self, password_hash, password):
+        """Novi hash (ispravne) lozinke ako spremljeni ne odgovara konfiguraciji, inače None"""
+        if not self.needs_rehash(password_hash):
+            return None
+        new_hash = self.hash(password)
+        self._count('rehashed')
+        return new_hash
+
+    def stats(self):
+        """Brojači i broj poziva koji trenutno čekaju ili se izvršavaju"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['in_flight'] = self._in_flight
+        stats['queue_capacity'] = self.queue_size
+        stats['workers'] = self.workers
+        return stats
+
+    def shutdown(self):
+        """Zaustavlja procese poola trenutnog procesa"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            owned = self._pid == os.getpid()
+        if executor is not None and owned:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,43 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenBucketLimiter:
+    """Token bucket po ključu (IP adresa, korisničko ime) u memoriji procesa.
+
+    Svaki ključ ima do burst tokena koji se pune brzinom rate po sekundi;
+    pokušaj troši jedan token. Pamti se najviše max_keys ključeva - najdulje
+    nekorišteni se izbacuju (a izbačeni ključ ponovno počinje s punim
+    spremnikom). Svaki proces ima svoje spremnike, pa je stvarni limit
+    (broj procesa) puta veći.
+    """
+
+    def __init__(self, rate, burst, max_keys=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()  # ključ -> (tokeni, vrijeme zadnjeg punjenja)
+        self.rejected = 0
+
+    def consume(self, key):
+        """Troši token; vraća 0 ako je pokušaj dozvoljen, inače broj sekundi do sljedećeg tokena"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                self.rejected += 1
+                wait = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def stats(self):
+        with self._lock:
+            return {'keys': len(self._buckets), 'rejected': self.rejected}
@@ -1,11 +1,29 @@
-from flask import render_template, redirect, url_for, flash, request
+import math
+from flask import render_template, redirect, url_for, flash, request, make_response
 from flask_login import login_user, logout_user, login_required, current_user
 from . import bp
 from .forms import LoginForm, RegisterForm, ProfileForm
 from .models import User
+from .passwords import PasswordHashingUnavailable
 from .email import send_verification_email
+from ..images import PROFILE_IMAGE_VARIANTS, ImageUploadError, store_image, delete_image
 from flask import current_app
 
+def _throttle(*limits):
+    """Troši token u svakom (config ključ limitera, ključ) paru; vraća najdulje čekanje ili 0"""
+    wait = 0
+    for config_key, key in limits:
+        limiter = current_app.config.get(config_key)
+        if limiter is not None:
+            wait = max(wait, limiter.consume(key))
+    return wait
+
+def _retry_later(template, form, status, retry_after):
+    """Forma ponovno s porukom, statusom 429/503 i Retry-After zaglavljem"""
+    response = make_response(render_template(template, form=form), status)
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
 @bp.route('/login', methods=['GET', 'POST'])
 def login():
     """Stranica za prijavu korisnika"""
@@ -15,9 +33,22 @@ def login():
     form = LoginForm()
     
     if form.validate_on_submit():
+        # Limit po IP adresi i po korisničkom imenu (pogađanje lozinke jednog računa s više adresa)
+        wait = _throttle(('AUTH_IP_LIMITER', request.remote_addr),
+                         ('AUTH_USER_LIMITER', form.username.data.lower()))
+        if wait:
+            flash('Previše pokušaja prijave. Pokušajte ponovno kasnije.', 'danger')
+            return _retry_later('login.html', form, 429, wait)
+        
         user = User.get_by_username(form.username.data)
         
-        if user and user.check_password(form.password.data):
+        try:
+            valid = user is not None and user.check_password(form.password.data)
+        except PasswordHashingUnavailable:
+            flash('Prijava je trenutno preopterećena. Pokušajte ponovno za nekoliko sekundi.', 'warning')
+            return _retry_later('login.html', form, 503, 1)
+        
+        if valid:
             # Provjeri je li email verificiran
             if not user.email_verified:
                 flash('Molimo verificirajte svoju email adresu prije prijave. Provjerite svoju email poštu.', 'warning')
@@ -45,6 +76,11 @@ def register():
     form = RegisterForm()
     
     if form.validate_on_submit():
+        wait = _throttle(('AUTH_IP_LIMITER', request.remote_addr))
+        if wait:
+            flash('Previše pokušaja registracije. Pokušajte ponovno kasnije.', 'danger')
+            return _retry_later('register.html', form, 429, wait)
+        
         try:
             user = User.create(
                 username=form.username.data,
@@ -59,6 +95,9 @@ def register():
             return redirect(url_for('auth.login'))
         except ValueError as e:
             flash(str(e), 'danger')
+        except PasswordHashingUnavailable:
+            flash('Registracija je trenutno preopterećena. Pokušajte ponovno za nekoliko sekundi.', 'warning')
+            return _retry_later('register.html', form, 503, 1)
     
     return render_template('register.html', form=form)
 
@@ -80,26 +119,30 @@ def profile():
 
     if form.validate_on_submit():
         profile_image_id = current_user.profile_image_id
+        profile_image_variants = None
         if form.profile_image.data:
-            # Obriši staru sliku ako postoji
+            # Spremi novu sliku
+            try:
+                new_image_id, profile_image_variants = store_image(
+                    current_app.config['DB'], fs, form.profile_image.data, PROFILE_IMAGE_VARIANTS
+                )
+            except ImageUploadError as e:
+                flash(str(e), 'danger')
+                return redirect(url_for('auth.profile'))
+            # Obriši staru sliku (i njezine varijante) ako postoji
             if profile_image_id:
                 try:
-                    fs.delete(profile_image_id)
+                    delete_image(fs, profile_image_id)
                 except Exception:
                     pass
-            # Spremi novu sliku
-            file = form.profile_image.data
-            profile_image_id = fs.put(
-                file.read(),
-                filename=file.filename,
-                content_type=file.content_type
-            )
+            profile_image_id = new_image_id
         # Ažuriraj profil
         current_user.update_profile(
             first_name=form.first_name.data,
             last_name=form.last_name.data,
             phone=form.phone.data,
-            profile_image_id=profile_image_id
+            profile_image_id=profile_image_id,
+            profile_image_variants=profile_image_variants
         )
         flash('Profil je ažuriran.', 'success')
         return redirect(url_for('auth.profile'))
@@ -109,7 +152,7 @@ def profile():
         form.last_name.data = current_user.last_name
         form.phone.data = current_user.phone
 
-    image_url = url_for('get_image', image_id=str(current_user.profile_image_id)) if current_user.profile_image_id else None
+    image_url = url_for('get_image', image_id=str(current_user.profile_image_id), size='avatar') if current_user.profile_image_id else None
     return render_template('profile.html', form=form, image_url=image_url)
 @bp.route('/verify-email/<token>')
 def verify_email(token):
@@ -0,0 +1,318 @@
+import http.client
+import io
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import quote, urlencode
+
+from bson import ObjectId
+from pymongo import monitoring
+from werkzeug.datastructures import FileStorage
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from .facets import rebuild_facet_counters
+from .images import AD_IMAGE_VARIANTS, Image, store_image
+from .indexes import LISTING_SORT
+from .search import build_search_fields, get_search_backend
+from .utils import encode_cursor, render_description_fields
+
+# Broj oglasa po stranici liste (kao u ads.routes.ads) i stranica za test duboke paginacije
+LISTING_PER_PAGE = 12
+DEEP_PAGE = 100
+
+# Korisnik koji se kreira u --memory načinu
+BENCH_USERNAME = 'bench'
+BENCH_PASSWORD = 'bench1234'
+
+BENCH_CATEGORIES = ['Elektronika', 'Dom i vrt', 'Automobili', 'Odjeća', 'Sport', 'Knjige', 'Ostalo']
+BENCH_WORDS = ['bicikl', 'laptop', 'stol', 'kauč', 'jakna', 'knjiga', 'mobitel', 'auto', 'gume', 'ormar',
+               'televizor', 'lopta', 'tenisice', 'monitor', 'stolica', 'hladnjak', 'roman', 'kaput']
+
+# Jedan scenarij: naziv, HTTP metoda, putanje (koriste se redom) i podaci forme
+Scenario = namedtuple('Scenario', 'name method paths data')
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+    """HTTP handler bez ispisa svakog zahtjeva"""
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Broji MongoDB naredbe zahtjeva (mora se registrirati prije kreiranja MongoClienta).
+
+    Listener je globalan za proces, pa se broje samo naredbe iz niti koja
+    upravo obrađuje zahtjev (od before_request do zatvaranja odgovora, uz
+    streamane chunkove slika) - pozadinske niti (sabirnica invalidacije,
+    upis pregleda) ne ulaze u broj naredbi po zahtjevu.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.count = 0
+
+    def attach(self, app):
+        """Označava niti koje obrađuju zahtjeve aplikacije"""
+        app.before_request(self._begin)
+        app.after_request(self._end_on_close)
+
+    def _begin(self):
+        self._local.active = True
+
+    def _end_on_close(self, response):
+        response.call_on_close(self._end)
+        return response
+
+    def _end(self):
+        self._local.active = False
+
+    def started(self, event):
+        if not getattr(self._local, 'active', False):
+            return
+        with self._lock:
+            self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def create_bench_app(memory=False):
+    """Kreira aplikaciju za benchmark (MONGODB_URI ili mongomock) i brojač naredbi.
+
+    Brojač je None u memory načinu jer mongomock ne šalje događaje monitoringa.
+    """
+    from . import create_app
+
+    if not memory:
+        counter = CommandCounter()
+        monitoring.register(counter)
+        app = create_app()
+        counter.attach(app)
+    else:
+        import mongomock
+        import mongomock.gridfs
+        mongomock.gridfs.enable_gridfs_integration()
+        counter = None
+        os.environ['MONGODB_ENSURE_INDEXES'] = 'False'
+        app = create_app(mongo_client=mongomock.MongoClient())
+        # mongomock ne podržava $text pa se koristi invertirani indeks
+        app.config['SEARCH_ENGINE'] = get_search_backend('inverted')
+    app.config['WTF_CSRF_ENABLED'] = False
+    # Scenarij login šalje sve zahtjeve s iste adrese za isti račun
+    app.config['AUTH_IP_LIMITER'] = app.config['AUTH_USER_LIMITER'] = None
+    return app, counter
+
+
+def _bench_image(rng):
+    """Mala generirana JPEG slika za seed podatke"""
+    image = Image.new('RGB', (1200, 900), tuple(rng.randrange(256) for _ in range(3)))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=85)
+    buffer.seek(0)
+    return FileStorage(stream=buffer, filename='bench.jpg', content_type='image/jpeg')
+
+
+def seed_database(app, num_ads, num_images=20, seed=0):
+    """Puni (praznu) bazu korisnikom i oglasima istog oblika kao oni iz forme"""
+    from .auth.models import User
+
+    rng = random.Random(seed)
+    with app.app_context():
+        db = app.config['DB']
+        user = User.create(BENCH_USERNAME, f'{BENCH_USERNAME}@example.com', BENCH_PASSWORD)
+        db['users'].update_one({'username': BENCH_USERNAME}, {'$set': {'email_verified': True}})
+        now = datetime.now()
+        ads = []
+        for i in range(num_ads):
+            words = rng.sample(BENCH_WORDS, 3)
+            description = ' '.join(rng.choice(BENCH_WORDS) for _ in range(40))
+            ad = {
+                'title': ' '.join(words).capitalize(),
+                'description': description,
+                'seller': BENCH_USERNAME,
+                'cellNo': '',
+                'price': round(rng.uniform(10, 5000), 2),
+                'category': rng.choice(BENCH_CATEGORIES),
+                'location': 'Zadar',
+                'image_id': None,
+                'created_at': now - timedelta(minutes=i),
+                'updated_at': now - timedelta(minutes=i),
+                'user_id': ObjectId(user.id),
+                'views': rng.randrange(1000)
+            }
+            if i < num_images and Image is not None:
+                ad['image_id'], ad['image_variants'] = store_image(db, app.config['GRIDFS'], _bench_image(rng),
+                                                                   AD_IMAGE_VARIANTS)
+            ad.update(render_description_fields(description))
+            ad['search'] = build_search_fields(ad)
+            ads.append(ad)
+        if ads:
+            db['ads'].insert_many(ads, ordered=False)
+            app.config['SEARCH_ENGINE'].rebuild(db, ads)
+            rebuild_facet_counters(db)
+
+
+def build_scenarios(app, username=None, password=None):
+    """Scenariji za postojeće podatke u bazi (ID-evi oglasa i slika, pojam za pretragu, duboki cursor)"""
+    db = app.config['DB']
+    sample = list(db['ads'].find({}, {'title': 1, 'category': 1, 'image_id': 1}).sort(LISTING_SORT).limit(100))
+    if not sample:
+        raise ValueError('Baza nema oglasa - pokreni add_test_data.py ili koristi --memory')
+
+    category = Counter(ad.get('category') for ad in sample).most_common(1)[0][0]
+    term = next((word for ad in sample for word in (ad.get('title') or '').split() if len(word) > 3), 'oglas')
+    scenarios = [
+        Scenario('index', 'GET', ['/'], None),
+        Scenario('ads', 'GET', ['/ads/'], None),
+        Scenario('ads_category', 'GET', [f'/ads/?category={quote(category)}'], None),
+        Scenario('ads_search', 'GET', [f'/ads/?search={quote(term)}'], None),
+        Scenario('ads_popular', 'GET', ['/ads/?sort=popular'], None),
+    ]
+
+    deep = next(iter(db['ads'].find({}, {'created_at': 1}).sort(LISTING_SORT)
+                     .skip((DEEP_PAGE - 1) * LISTING_PER_PAGE - 1).limit(1)), None)
+    if deep is not None:
+        scenarios.append(Scenario('ads_deep', 'GET', [f'/ads/?page={DEEP_PAGE}&after={encode_cursor(deep)}'], None))
+
+    scenarios.append(Scenario('ad_detail', 'GET', [f"/ads/{ad['_id']}" for ad in sample], None))
+    images = [f"/image/{ad['image_id']}?size=card" for ad in sample if ad.get('image_id')]
+    if images:
+        scenarios.append(Scenario('image', 'GET', images, None))
+
+    if username is None:
+        user = db['users'].find_one({'username': {'$regex': '^test_'}}, {'username': 1})
+        username = user['username'] if user else None
+    if username and password:
+        scenarios.append(Scenario('login', 'POST', ['/auth/login'], {'username': username, 'password': password}))
+    return scenarios
+
+
+def percentile(sorted_values, pct):
+    """Percentil (nearest-rank) sortirane liste"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+
+def _client_sender(app, scenario):
+    """Šalje zahtjeve kroz Flask test klijent (jedan klijent po niti)"""
+    local = threading.local()
+
+    def send(i):
+        # POST (prijava) uvijek ide s novim klijentom - prijavljeni korisnik bi dobio redirect
+        if scenario.method == 'POST' or not hasattr(local, 'client'):
+            local.client = app.test_client()
+        path = scenario.paths[i % len(scenario.paths)]
+        start = time.perf_counter()
+        response = local.client.open(path, method=scenario.method, data=scenario.data)
+        response.get_data()
+        return time.perf_counter() - start, response.status_code
+    return send
+
+
+def _http_sender(host, port, scenario):
+    """Šalje zahtjeve stvarnim HTTP-om na lokalni server"""
+    body = urlencode(scenario.data) if scenario.data else None
+    headers = {'Content-Type': 'application/x-www-form-urlencoded'} if body else {}
+
+    def send(i):
+        path = scenario.paths[i % len(scenario.paths)]
+        start = time.perf_counter()
+        connection = http.client.HTTPConnection(host, port, timeout=30)
+        try:
+            connection.request(scenario.method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+        finally:
+            connection.close()
+        return time.perf_counter() - start, response.status
+    return send
+
+
+def run_scenario(send, num_requests, concurrency, warmup, counter):
+    """Izvršava scenarij i vraća propusnost, percentile latencije i MongoDB naredbe po zahtjevu"""
+    for i in range(warmup):
+        send(i)
+
+    commands_before = counter.count if counter else 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(send, range(num_requests)))
+    duration = time.perf_counter() - started
+
+    latencies = sorted(latency * 1000 for latency, _ in samples)
+    statuses = Counter(status for _, status in samples)
+    return {
+        'requests': num_requests,
+        'errors': sum(n for status, n in statuses.items() if status >= 400),
+        'statuses': {str(status): n for status, n in sorted(statuses.items())},
+        'rps': round(num_requests / duration, 1),
+        'mean_ms': round(sum(latencies) / len(latencies), 2),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'mongo_commands_per_request': (
+            round((counter.count - commands_before) / num_requests, 2) if counter else None
+        ),
+    }
+
+
+def run_benchmark(app, scenarios, num_requests, concurrency=1, warmup=10, counter=None, use_http=False):
+    """Pokreće sve scenarije redom; s use_http aplikacija radi kao stvarni HTTP server u niti"""
+    server = None
+    if use_http:
+        server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=_QuietRequestHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        routes = {}
+        for scenario in scenarios:
+            if server is not None:
+                send = _http_sender('127.0.0.1', server.server_port, scenario)
+            else:
+                send = _client_sender(app, scenario)
+            routes[scenario.name] = run_scenario(send, num_requests, concurrency, warmup, counter)
+            yield scenario.name, routes[scenario.name]
+    finally:
+        if server is not None:
+            server.shutdown()
+
+
+def compare_to_baseline(results, baseline, threshold):
+    """Vraća listu regresija (p95, propusnost ili broj MongoDB naredbi lošiji za više od threshold)"""
+    regressions = []
+    for name, current in results['routes'].items():
+        base = baseline.get('routes', {}).get(name)
+        if not base:
+            continue
+        if current['p95_ms'] > base['p95_ms'] * (1 + threshold):
+            regressions.append(f"{name}: p95 {base['p95_ms']} ms -> {current['p95_ms']} ms")
+        if current['rps'] < base['rps'] / (1 + threshold):
+            regressions.append(f"{name}: {base['rps']} -> {current['rps']} zahtjeva/s")
+        base_commands = base.get('mongo_commands_per_request')
+        commands = current.get('mongo_commands_per_request')
+        if base_commands is not None and commands is not None and commands > base_commands * (1 + threshold):
+            regressions.append(f"{name}: {base_commands} -> {commands} MongoDB naredbi po zahtjevu")
+    return regressions
+
+
+def load_results(path):
+    """Učitava spremljene rezultate (baseline)"""
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_results(path, results):
+    """Sprema rezultate kao JSON (može poslužiti kao baseline)"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,259 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+
+
+class TTLCache:
+    """Thread-safe cache unutar procesa s rokom trajanja (TTL) i ograničenim brojem unosa"""
+
+    def __init__(self, ttl, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Vraća vrijednost ili default ako unos ne postoji ili je istekao"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Sprema vrijednost; najstariji unos se izbacuje kad se prijeđe max_entries"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """Briše jedan unos"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_where(self, predicate):
+        """Briše sve unose čiji ključ zadovoljava predicate(key)"""
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self):
+        """Briše sve unose"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class LRUByteCache:
+    """Thread-safe LRU cache ograničen ukupnom veličinom vrijednosti (u bajtovima).
+
+    Objekti veći od max_object_size se ne keširaju. Brojači pogodaka,
+    promašaja i izbacivanja dostupni su preko stats().
+    """
+
+    def __init__(self, max_bytes, max_object_size):
+        self.max_bytes = max_bytes
+        self.max_object_size = max_object_size
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def accepts(self, size):
+        """Može li objekt zadane veličine uopće ući u cache"""
+        return size <= self.max_object_size and size <= self.max_bytes
+
+    def get(self, key):
+        """Vraća vrijednost (i označava je kao nedavno korištenu) ili None"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, size):
+        """Sprema vrijednost i izbacuje najstarije unose dok ne stane u budžet"""
+        if not self.accepts(size):
+            return False
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            while self._data and self.current_bytes + size > self.max_bytes:
+                _, (_, evicted_size) = self._data.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+            self._data[key] = (value, size)
+            self.current_bytes += size
+            return True
+
+    def delete_where(self, predicate):
+        """Briše sve unose čiji ključ zadovoljava predicate(key)"""
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                _, size = self._data.pop(key)
+                self.current_bytes -= size
+
+    def clear(self):
+        """Briše sve unose"""
+        with self._lock:
+            self._data.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        """Trenutno stanje i brojači cachea"""
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ResponseCache:
+    """Cache renderiranih stranica s brojačem generacija.
+
+    Svaka promjena oglasa povećava generaciju, čime sve spremljene stranice
+    postaju nevažeće; TTL je samo gornja granica starosti.
+    """
+
+    def __init__(self, ttl, max_entries=256):
+        self.generation = 0
+        self._cache = TTLCache(ttl, max_entries)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self._cache.get((self.generation, key))
+
+    def set(self, key, value, generation=None):
+        """Sprema stranicu; generation je generacija s početka renderiranja.
+
+        Ako se generacija u međuvremenu promijenila, stranica je možda
+        renderirana iz starih podataka pa se ne sprema.
+        """
+        with self._lock:
+            if generation is None:
+                generation = self.generation
+            elif generation != self.generation:
+                return False
+            self._cache.set((generation, key), value)
+            return True
+
+    def bump(self):
+        """Nova generacija - sve dosad spremljene stranice se više ne koriste"""
+        with self._lock:
+            self.generation += 1
+        self._cache.clear()
+
+
+def _is_cacheable_request():
+    """Keširaju se samo GET zahtjevi anonimnih posjetitelja bez parametara i flash poruka"""
+    return (request.method == 'GET'
+            and not request.args
+            and not current_user.is_authenticated
+            and '_flashes' not in session)
+
+
+def _is_revalidatable_request():
+    """Uvjetni GET (ETag/Last-Modified) samo za anonimne posjetitelje bez flash poruka.
+
+    Stranice prijavljenih korisnika sadrže CSRF token i navigaciju ovisnu o
+    korisniku, pa se za njih validatori ne šalju.
+    """
+    return (request.method in ('GET', 'HEAD')
+            and not current_user.is_authenticated
+            and '_flashes' not in session)
+
+
+def page_etag(*parts):
+    """ETag stranice iz vrijednosti o kojima ovisi njezin sadržaj"""
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:20]
+
+
+def _apply_validators(response, etag, last_modified=None):
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Klijent/CDN smije čuvati stranicu, ali je mora provjeriti prije svake upotrebe
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    return response
+
+
+def not_modified(etag, last_modified=None):
+    """Vraća 304 odgovor ako klijent već ima ovu verziju stranice, inače None (poziva se prije renderiranja)"""
+    if not _is_revalidatable_request() or not (request.if_none_match or request.if_modified_since):
+        return None
+    response = _apply_validators(current_app.response_class(), etag, last_modified)
+    response.make_conditional(request)
+    return response if response.status_code == 304 else None
+
+
+def with_validators(response, etag, last_modified=None):
+    """Dodaje ETag/Last-Modified renderiranoj stranici (samo za anonimne posjetitelje)"""
+    response = make_response(response)
+    if response.status_code == 200 and _is_revalidatable_request():
+        _apply_validators(response, etag, last_modified)
+    return response
+
+
+def cached_page(view):
+    """Dekorator koji sprema renderiranu stranicu u RESPONSE_CACHE"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        cache = current_app.config.get('RESPONSE_CACHE')
+        if cache is None or not _is_cacheable_request():
+            return view(*args, **kwargs)
+        
+        cached = cache.get(request.path)
+        if cached is not None:
+            body, mimetype, etag = cached
+            response = current_app.response_class(body, mimetype=mimetype)
+            response.headers['X-Cache'] = 'HIT'
+            if etag:
+                _apply_validators(response, etag)
+                response.make_conditional(request)
+            return response
+        
+        # Generacija prije renderiranja - promjena oglasa tijekom renderiranja poništava spremanje
+        generation = cache.generation
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200 and not response.direct_passthrough:
+            cache.set(request.path, (response.get_data(), response.mimetype, response.get_etag()[0]), generation)
+        response.headers['X-Cache'] = 'MISS'
+        return response
+    return wrapper
+
+
+def invalidate_pages(sender, old=None, new=None, remote=False):
+    """ad_changed handler - nova generacija keširanih stranica"""
+    cache = sender.config.get('RESPONSE_CACHE')
+    if cache is not None:
+        cache.bump()
@@ -0,0 +1,190 @@
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from pymongo import UpdateOne
+
+from .facets import rebuild_facet_counters
+from .indexes import ensure_indexes, verify_indexes
+from .search import build_search_fields
+from .utils import RENDERER_VERSION, render_description_fields
+
+indexes_cli = AppGroup('indexes', help='Upravljanje MongoDB indeksima')
+search_cli = AppGroup('search', help='Održavanje indeksa za pretragu oglasa')
+ads_cli = AppGroup('ads', help='Održavanje podataka oglasa')
+descriptions_cli = AppGroup('descriptions', help='Održavanje renderiranih opisa oglasa')
+facets_cli = AppGroup('facets', help='Održavanje brojača za facete')
+bench_cli = AppGroup('bench', help='Benchmark ruta (latencija, propusnost, MongoDB naredbe)')
+
+
+@indexes_cli.command('create')
+def create_indexes_command():
+    """Kreira sve deklarirane indekse"""
+    names = ensure_indexes(current_app.config['DB'])
+    click.echo(f"✅ Indeksi su postavljeni: {', '.join(names)}")
+
+
+@indexes_cli.command('check')
+def check_indexes_command():
+    """Pokreće explain() za svaki oblik upita i javlja COLLSCAN/SORT planove"""
+    results = verify_indexes(current_app.config['DB'])
+    failed = 0
+    for name, stages, ok in results:
+        status = '✅' if ok else '❌'
+        click.echo(f"{status} {name}: {' -> '.join(stages)}")
+        if not ok:
+            failed += 1
+    if failed:
+        click.echo(f"❌ {failed} upita nije pokriveno indeksom")
+        raise SystemExit(1)
+
+
+@search_cli.command('reindex')
+@click.option('--batch-size', default=500, show_default=True, help='Broj oglasa po seriji')
+def reindex_command(batch_size):
+    """Ponovno analizira sve oglase i obnavlja indeks za pretragu"""
+    db = current_app.config['DB']
+    search_engine = current_app.config['SEARCH_ENGINE']
+    projection = {'title': 1, 'description': 1, 'category': 1, 'location': 1}
+    total = 0
+    batch = []
+    for ad in db['ads'].find({}, projection, batch_size=batch_size):
+        batch.append(ad)
+        if len(batch) >= batch_size:
+            total += _reindex_batch(db, search_engine, batch)
+            batch = []
+    if batch:
+        total += _reindex_batch(db, search_engine, batch)
+    click.echo(f"✅ Reindeksirano {total} oglasa ({search_engine.name})")
+
+
+def _reindex_batch(db, search_engine, ads):
+    """Sprema ad['search'] polja i obnavlja pretraživač za jednu seriju oglasa"""
+    db['ads'].bulk_write([
+        UpdateOne({'_id': ad['_id']}, {'$set': {'search': build_search_fields(ad)}}) for ad in ads
+    ], ordered=False)
+    search_engine.rebuild(db, ads)
+    return len(ads)
+
+
+@ads_cli.command('backfill-updated-at')
+def backfill_updated_at_command():
+    """Postavlja updated_at = created_at oglasima spremljenima prije uvođenja polja"""
+    result = current_app.config['ADS_COLLECTION'].update_many(
+        {'updated_at': {'$exists': False}},
+        [{'$set': {'updated_at': '$created_at'}}]
+    )
+    click.echo(f"✅ updated_at postavljen za {result.modified_count} oglasa")
+
+
+@ads_cli.command('backfill-views')
+def backfill_views_command():
+    """Postavlja views = 0 oglasima spremljenima prije brojanja pregleda"""
+    result = current_app.config['ADS_COLLECTION'].update_many(
+        {'views': {'$exists': False}},
+        {'$set': {'views': 0}}
+    )
+    click.echo(f"✅ views postavljen za {result.modified_count} oglasa")
+
+
+@descriptions_cli.command('rerender')
+@click.option('--batch-size', default=500, show_default=True, help='Broj oglasa po seriji')
+@click.option('--all', 'rerender_all', is_flag=True, help='Renderiraj i oglase s trenutnom verzijom')
+def rerender_command(batch_size, rerender_all):
+    """Ponovno renderira opise oglasa (nakon promjene ALLOWED_TAGS/ALLOWED_ATTRIBUTES ili markdown extras)"""
+    ads_collection = current_app.config['ADS_COLLECTION']
+    query = {} if rerender_all else {'description_html_version': {'$ne': RENDERER_VERSION}}
+    total = 0
+    batch = []
+    for ad in ads_collection.find(query, {'description': 1}, batch_size=batch_size):
+        batch.append(UpdateOne(
+            {'_id': ad['_id'], 'description': ad.get('description')},
+            {'$set': render_description_fields(ad.get('description'))}
+        ))
+        if len(batch) >= batch_size:
+            total += ads_collection.bulk_write(batch, ordered=False).modified_count
+            batch = []
+    if batch:
+        total += ads_collection.bulk_write(batch, ordered=False).modified_count
+    click.echo(f"✅ Ponovno renderirano {total} opisa (verzija {RENDERER_VERSION})")
+
+
+@facets_cli.command('rebuild')
+def rebuild_facets_command():
+    """Ponovno izračunava brojače po kategorijama i cjenovnim razredima iz oglasa"""
+    total = rebuild_facet_counters(current_app.config['DB'])
+    current_app.config['AD_COUNTER'].facet_cache.clear()
+    click.echo(f"✅ Brojači za facete obnovljeni ({total} kategorija)")
+
+
+@bench_cli.command('run')
+@click.option('--memory', is_flag=True, help='mongomock s generiranim podacima umjesto MONGODB_URI')
+@click.option('--seed-ads', default=1000, show_default=True, help='Broj generiranih oglasa u --memory načinu')
+@click.option('--requests', 'num_requests', default=200, show_default=True, help='Broj zahtjeva po ruti')
+@click.option('--concurrency', default=1, show_default=True, help='Broj istovremenih klijenata')
+@click.option('--warmup', default=10, show_default=True, help='Zahtjevi prije mjerenja')
+@click.option('--http', 'use_http', is_flag=True, help='Stvarni HTTP server umjesto Flask test klijenta')
+@click.option('--routes', default='', help='Samo navedeni scenariji (odvojeni zarezom)')
+@click.option('--username', default=None, help='Korisnik za scenarij prijave (zadano prvi test_ korisnik)')
+@click.option('--password', default='test1234', show_default=True, help='Lozinka za scenarij prijave')
+@click.option('--output', type=click.Path(dir_okay=False), help='Spremi rezultate kao JSON (baseline)')
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False), help='Usporedi s baseline JSON-om')
+@click.option('--threshold', default=0.2, show_default=True, help='Dopušteno pogoršanje (0.2 = 20 %)')
+def bench_command(memory, seed_ads, num_requests, concurrency, warmup, use_http, routes, username, password,
+                  output, baseline, threshold):
+    """Mjeri p50/p95/p99 latenciju, propusnost i MongoDB naredbe po zahtjevu za glavne rute"""
+    from . import benchmark
+
+    try:
+        app, counter = benchmark.create_bench_app(memory)
+    except ImportError:
+        raise click.ClickException('--memory zahtijeva mongomock (pip install mongomock)')
+    if memory:
+        click.echo(f"Generiram {seed_ads} oglasa u memoriji...")
+        benchmark.seed_database(app, seed_ads)
+        username, password = username or benchmark.BENCH_USERNAME, benchmark.BENCH_PASSWORD
+
+    with app.app_context():
+        try:
+            scenarios = benchmark.build_scenarios(app, username, password)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+    if routes:
+        selected = set(routes.split(','))
+        scenarios = [scenario for scenario in scenarios if scenario.name in selected]
+
+    results = {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'memory': memory, 'http': use_http, 'requests': num_requests, 'concurrency': concurrency,
+        },
+        'routes': {},
+    }
+    click.echo(f"{'ruta':<14}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'mongo/req':>11}{'greške':>8}")
+    for name, stats in benchmark.run_benchmark(app, scenarios, num_requests, concurrency, warmup, counter, use_http):
+        results['routes'][name] = stats
+        commands = stats['mongo_commands_per_request']
+        click.echo(f"{name:<14}{stats['rps']:>9}{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}"
+                   f"{'-' if commands is None else commands:>11}{stats['errors']:>8}")
+
+    if output:
+        benchmark.save_results(output, results)
+        click.echo(f"✅ Rezultati spremljeni u {output}")
+    if baseline:
+        regressions = benchmark.compare_to_baseline(results, benchmark.load_results(baseline), threshold)
+        for regression in regressions:
+            click.echo(f"❌ {regression}")
+        if regressions:
+            raise SystemExit(1)
+        click.echo(f"✅ Nema regresija većih od {threshold:.0%} u odnosu na {baseline}")
+
+
+def register_commands(app):
+    """Registrira CLI naredbe aplikacije"""
+    app.cli.add_command(indexes_cli)
+    app.cli.add_command(search_cli)
+    app.cli.add_command(ads_cli)
+    app.cli.add_command(descriptions_cli)
+    app.cli.add_command(facets_cli)
+    app.cli.add_command(bench_cli)
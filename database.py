@@ -0,0 +1,305 @@
+import os
+import threading
+import time
+
+import gridfs
+from flask import current_app, has_request_context, jsonify, request, session
+from pymongo import MongoClient, monitoring
+from pymongo.errors import PyMongoError
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import SecondaryPreferred
+from werkzeug.local import LocalProxy
+
+# Opcije poola iz okruženja: varijabla -> opcija MongoClienta
+POOL_OPTIONS = {
+    'MONGODB_MAX_POOL_SIZE': 'maxPoolSize',
+    'MONGODB_MIN_POOL_SIZE': 'minPoolSize',
+    'MONGODB_MAX_IDLE_TIME_MS': 'maxIdleTimeMS',
+    'MONGODB_WAIT_QUEUE_TIMEOUT_MS': 'waitQueueTimeoutMS',
+    'MONGODB_CONNECT_TIMEOUT_MS': 'connectTimeoutMS',
+    'MONGODB_SOCKET_TIMEOUT_MS': 'socketTimeoutMS',
+    'MONGODB_SERVER_SELECTION_TIMEOUT_MS': 'serverSelectionTimeoutMS',
+}
+
+
+# Endpointi koji za anonimne GET zahtjeve čitaju sa sekundarnih čvorova
+DEFAULT_SECONDARY_READ_ENDPOINTS = 'main.index,ads.ads,get_image'
+
+
+def pool_options_from_env(environ=os.environ):
+    """Opcije poola zadane u okruženju (nepostavljene ostaju na zadanim vrijednostima pymonga)"""
+    return {option: int(environ[name]) for name, option in POOL_OPTIONS.items() if environ.get(name)}
+
+
+def _max_staleness(environ=os.environ):
+    return int(environ.get('MONGODB_MAX_STALENESS_SECONDS', 90))
+
+
+def secondary_read_options(environ=os.environ):
+    """Read preference i read concern profila 'secondary'.
+
+    MongoDB traži maxStalenessSeconds od najmanje 90 sekundi; -1 uklanja
+    ograničenje. Na samostalnom mongod-u read preference nema učinka.
+    """
+    return {
+        'read_preference': SecondaryPreferred(max_staleness=_max_staleness(environ)),
+        'read_concern': ReadConcern(environ.get('MONGODB_SECONDARY_READ_CONCERN', 'local')),
+    }
+
+
+def primary_window_after_change(environ=os.environ):
+    """Koliko sekundi nakon promjene oglasa sve čitanje ide s primarnog čvora.
+
+    Dopuštena zastarjelost plus jedan heartbeat (procjena kašnjenja sekundarnog
+    čvora osvježava se svakih 10 s); bez ograničenja zastarjelosti (-1) uzima se 90.
+    """
+    max_staleness = _max_staleness(environ)
+    return (max_staleness if max_staleness > 0 else 90) + 10
+
+
+class SecondaryReadRoute:
+    """Za trenutni zahtjev vraća 'secondary' ili None (primary).
+
+    Sekundarni čvorovi se koriste samo za anonimne GET/HEAD zahtjeve zadanih
+    endpointa; prijavljeni korisnik (koji je možda upravo nešto spremio), vlasnički
+    pogledi i svi upisi čitaju s primarnog čvora. Nakon promjene oglasa (pin_primary)
+    i ti zahtjevi primary_window sekundi čitaju s primarnog, pa se ispražnjeni
+    cachevi (stranice, brojači) ne pune podacima od prije promjene.
+    """
+
+    def __init__(self, endpoints, primary_window=100):
+        self.endpoints = frozenset(endpoints)
+        self.primary_window = primary_window
+        self._primary_until = 0.0
+
+    def pin_primary(self):
+        """Sljedećih primary_window sekundi svi zahtjevi čitaju s primarnog čvora"""
+        self._primary_until = time.monotonic() + self.primary_window
+
+    def __call__(self):
+        if (not has_request_context() or request.endpoint not in self.endpoints
+                or request.method not in ('GET', 'HEAD')):
+            return None
+        if time.monotonic() < self._primary_until:
+            return None
+        # current_user bi učitao korisnika upitom, pa se prijava prepoznaje po sesiji i remember cookieju
+        if current_app.config.get('REMEMBER_COOKIE_NAME', 'remember_token') in request.cookies:
+            return None
+        # Čitanje sesije bi je označilo kao korištenu (Vary: Cookie na javnim, keširanim odgovorima)
+        accessed = getattr(session, 'accessed', None)
+        logged_in = session.get('_user_id')
+        if accessed is not None:
+            session.accessed = accessed
+        return None if logged_in else 'secondary'
+
+
+def pin_primary_reads(sender, old=None, new=None, remote=False):
+    """ad_changed handler - nakon promjene (i iz drugog procesa) cachevi se pune s primarnog čvora"""
+    route = sender.config['MONGO'].route
+    if isinstance(route, SecondaryReadRoute):
+        route.pin_primary()
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Stanje poola konekcija jednog klijenta: otvorene i zauzete konekcije, čekanje na konekciju"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checkout = threading.local()
+        self.open = 0
+        self.in_use = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.clears = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'open': self.open,
+                'in_use': self.in_use,
+                'checkouts': self.checkouts,
+                'checkout_failures': self.checkout_failures,
+                'wait_seconds_total': round(self.wait_seconds_total, 6),
+                'wait_seconds_max': round(self.wait_seconds_max, 6),
+                'clears': self.clears,
+            }
+
+    # Čekanje se mjeri od zahtjeva za konekcijom do njezinog dobivanja (ista nit)
+    def connection_check_out_started(self, event):
+        self._checkout.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        waited = time.perf_counter() - getattr(self._checkout, 'started', time.perf_counter())
+        with self._lock:
+            self.in_use += 1
+            self.checkouts += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use -= 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open -= 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.clears += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+
+class MongoConnection:
+    """MongoClient koji se kreira lijeno, zasebno u svakom procesu.
+
+    Pymongo klijent se ne smije dijeliti preko fork-a (npr. gunicorn --preload),
+    pa se klijent (i njegov pool) kreira pri prvoj upotrebi u procesu, a nakon
+    fork-a proces radnik automatski dobiva novi. Zadani client (npr. mongomock)
+    koristi se bez te provjere.
+
+    read_profiles su imenovane opcije čitanja (read_preference, read_concern), a
+    route funkcija koja za trenutni zahtjev vraća ime profila ili None - proxyji
+    kreirani s routed=True prema njoj biraju bazu/kolekciju za čitanje.
+    """
+
+    def __init__(self, uri, db_name, options=None, event_listeners=(), client=None, read_profiles=None,
+                 route=None):
+        self.uri = uri
+        self.db_name = db_name
+        self.options = options or {}
+        self.event_listeners = list(event_listeners)
+        self.read_profiles = read_profiles or {}
+        self.route = route
+        self._fixed = client is not None
+        self._lock = threading.Lock()
+        self._pid = None
+        self._client = client
+        self._pool_stats = None
+        self._collections = {}
+        self._gridfs = {}
+
+    def _connect(self):
+        """Kreira klijenta za trenutni proces (klijent naslijeđen od roditelja se ne koristi)"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if not self._fixed:
+                self._pool_stats = PoolStats()
+                self._client = MongoClient(self.uri, event_listeners=self.event_listeners + [self._pool_stats],
+                                           **self.options)
+            self._collections = {}
+            self._gridfs = {}
+            self._pid = os.getpid()
+
+    @property
+    def client(self):
+        if self._pid != os.getpid():
+            self._connect()
+        return self._client
+
+    @property
+    def db(self):
+        return self.client[self.db_name]
+
+    def db_for(self, profile=None):
+        """Baza s opcijama čitanja zadanog profila (None - zadane opcije klijenta, primary)"""
+        if profile is None:
+            return self.db
+        return self.client.get_database(self.db_name, **self.read_profiles[profile])
+
+    def collection(self, name, profile=None):
+        """Kolekcija iz klijenta trenutnog procesa (objekti kolekcija se ponovno koriste)"""
+        client = self.client
+        collection = self._collections.get((name, profile))
+        if collection is None:
+            options = self.read_profiles[profile] if profile is not None else {}
+            collection = self._collections[(name, profile)] = client[self.db_name].get_collection(name, **options)
+        return collection
+
+    def gridfs_for(self, profile=None):
+        if self._pid != os.getpid():
+            self._connect()
+        fs = self._gridfs.get(profile)
+        if fs is None:
+            fs = self._gridfs[profile] = gridfs.GridFS(self.db_for(profile))
+        return fs
+
+    @property
+    def gridfs(self):
+        return self.gridfs_for(None)
+
+    def _routed_profile(self):
+        return self.route() if self.route is not None else None
+
+    def proxy(self, name, routed=False):
+        """LocalProxy za spremanje u app.config (DB, kolekcije, GRIDFS) - uvijek pokazuje na klijenta procesa.
+
+        routed=True: opcije čitanja bira route() za trenutni zahtjev (upisi uvijek idu na primary).
+        """
+        profile = self._routed_profile if routed else (lambda: None)
+        if name == 'db':
+            return LocalProxy(lambda: self.db_for(profile()))
+        if name == 'gridfs':
+            return LocalProxy(lambda: self.gridfs_for(profile()))
+        return LocalProxy(lambda: self.collection(name, profile()))
+
+    def ping(self):
+        """Provjerava dostupnost baze (podiže PyMongoError ako nije dostupna)"""
+        self.client.admin.command('ping')
+
+    def pool_stats(self):
+        """Stanje poola trenutnog procesa (prazno prije prve upotrebe ili za zadani client)"""
+        if self._pool_stats is None or self._pid != os.getpid():
+            return {}
+        return self._pool_stats.stats()
+
+    def close(self):
+        """Zatvara klijenta trenutnog procesa (sljedeća upotreba otvara novog)"""
+        with self._lock:
+            if self._client is not None and not self._fixed and self._pid == os.getpid():
+                self._client.close()
+                self._client = None
+                self._pid = None
+
+
+def liveness_view():
+    """Proces radi (bez provjere baze)"""
+    return jsonify(status='ok')
+
+
+def readiness_view():
+    """Proces je spreman primati zahtjeve - baza odgovara na ping (503 ako ne)"""
+    mongo = current_app.config['MONGO']
+    try:
+        mongo.ping()
+    except PyMongoError as e:
+        return jsonify(status='unavailable', error=str(e)), 503
+    return jsonify(status='ok', pid=os.getpid(), pool=mongo.pool_stats())
+
+
+def register_health(app):
+    """Registrira /health/live i /health/ready endpointe"""
+    app.add_url_rule('/health/live', 'health_live', liveness_view)
+    app.add_url_rule('/health/ready', 'health_ready', readiness_view)
@@ -0,0 +1,144 @@
+from datetime import datetime
+
+from pymongo import ReplaceOne, UpdateOne
+
+# Kolekcija s brojačima po kategoriji: {_id: kategorija, count: n, prices: {razred: n}}
+COUNTERS_COLLECTION = 'ads_facet_counts'
+
+# Oznaka da su brojači izgrađeni iz cijele kolekcije (upisuje je rebuild_facet_counters)
+BUILT_MARKER_ID = '$built'
+
+# Cjenovni razredi (€): ključ je donja granica, zadnji razred nema gornju granicu
+PRICE_BUCKETS = [
+    (0, 50, 'do 50 €'),
+    (50, 100, '50 - 100 €'),
+    (100, 500, '100 - 500 €'),
+    (500, 1000, '500 - 1000 €'),
+    (1000, 5000, '1000 - 5000 €'),
+    (5000, None, 'više od 5000 €'),
+]
+
+
+def price_bucket(price):
+    """Ključ cjenovnog razreda za zadanu cijenu"""
+    for lower, upper, _ in PRICE_BUCKETS:
+        if upper is None or (price or 0) < upper:
+            return str(lower)
+
+
+def _price_bucket_expression():
+    """Isti razredi kao price_bucket(), kao izraz za agregaciju"""
+    branches = [{'case': {'$lt': [{'$ifNull': ['$price', 0]}, upper]}, 'then': str(lower)}
+                for lower, upper, _ in PRICE_BUCKETS if upper is not None]
+    return {'$switch': {'branches': branches, 'default': str(PRICE_BUCKETS[-1][0])}}
+
+
+def _facet_stage(category=None):
+    """$facet: brojevi po svim kategorijama i cjenovni razredi (unutar odabrane kategorije)"""
+    prices = [{'$group': {'_id': _price_bucket_expression(), 'n': {'$sum': 1}}}]
+    if category:
+        prices.insert(0, {'$match': {'category': category}})
+    return {'$facet': {
+        'categories': [{'$group': {'_id': '$category', 'n': {'$sum': 1}}}],
+        'prices': prices,
+    }}
+
+
+def _format(categories, prices):
+    """Rezultat za predložak: {'categories': {kategorija: n}, 'prices': [(oznaka, n)], 'total': n}"""
+    categories = {category: n for category, n in categories.items() if category and n > 0}
+    return {
+        'categories': categories,
+        'total': sum(categories.values()),
+        'prices': [(label, prices.get(str(lower), 0)) for lower, _, label in PRICE_BUCKETS],
+    }
+
+
+def aggregate_facets(db, search_engine=None, search=None, category=None):
+    """Faceti jednom $facet agregacijom (nad pogocima pretrage ili nad svim oglasima)"""
+    if search:
+        source = search_engine.match_stages({}, search)
+        if source is None:
+            return _format({}, {})
+        collection_name, stages = source
+    else:
+        collection_name, stages = 'ads', []
+    result = next(db[collection_name].aggregate(stages + [_facet_stage(category)]), None) or {}
+    return _format({doc['_id']: doc['n'] for doc in result.get('categories', [])},
+                   {doc['_id']: doc['n'] for doc in result.get('prices', [])})
+
+
+def read_facets(db, category=None):
+    """Faceti iz održavanih brojača (jedan upit na najviše par dokumenata).
+
+    Vraća None dok brojači nisu izgrađeni (flask facets rebuild) - $inc upsert
+    iz update_facet_counters nad postojećim oglasima kreira brojače samo iz
+    jedne promjene, pa se do tada faceti računaju agregacijom.
+    """
+    docs = list(db[COUNTERS_COLLECTION].find())
+    if not any(doc['_id'] == BUILT_MARKER_ID for doc in docs):
+        return None
+    docs = [doc for doc in docs if doc['_id'] != BUILT_MARKER_ID]
+    prices = {}
+    for doc in docs:
+        if not category or doc['_id'] == category:
+            for bucket, n in (doc.get('prices') or {}).items():
+                prices[bucket] = prices.get(bucket, 0) + n
+    return _format({doc['_id']: doc.get('count', 0) for doc in docs}, prices)
+
+
+def get_facets(db, search_engine=None, search=None, category=None):
+    """Faceti za listu oglasa; brojači se koriste uvijek osim za pretragu (i dok nisu izgrađeni)"""
+    if not search:
+        facets = read_facets(db, category)
+        if facets is not None:
+            return facets
+    return aggregate_facets(db, search_engine, search, category)
+
+
+def _counter_update(ad, sign):
+    return UpdateOne(
+        {'_id': ad.get('category')},
+        {'$inc': {'count': sign, f"prices.{price_bucket(ad.get('price'))}": sign}},
+        upsert=True
+    )
+
+
+def update_facet_counters(sender, old=None, new=None, remote=False):
+    """ad_changed handler - $inc brojača kategorije i cjenovnog razreda (jedan bulk_write)"""
+    if remote:
+        # Brojače je već ažurirao proces u kojem se oglas promijenio
+        return
+    if old and new and old.get('category') == new.get('category') \
+            and price_bucket(old.get('price')) == price_bucket(new.get('price')):
+        return
+    requests = []
+    if old:
+        requests.append(_counter_update(old, -1))
+    if new:
+        requests.append(_counter_update(new, 1))
+    if requests:
+        sender.config['DB'][COUNTERS_COLLECTION].bulk_write(requests, ordered=False)
+
+
+def rebuild_facet_counters(db):
+    """Ponovno izračunava sve brojače iz kolekcije oglasa; vraća broj kategorija"""
+    pipeline = [{'$group': {
+        '_id': {'category': '$category', 'bucket': _price_bucket_expression()},
+        'n': {'$sum': 1},
+    }}]
+    counters = {}
+    for doc in db['ads'].aggregate(pipeline, allowDiskUse=True):
+        category = doc['_id'].get('category')
+        counter = counters.setdefault(category, {'_id': category, 'count': 0, 'prices': {}})
+        counter['count'] += doc['n']
+        counter['prices'][doc['_id']['bucket']] = doc['n']
+    collection = db[COUNTERS_COLLECTION]
+    if counters:
+        collection.bulk_write([ReplaceOne({'_id': c['_id']}, c, upsert=True) for c in counters.values()],
+                              ordered=False)
+    collection.delete_many({'_id': {'$nin': list(counters) + [BUILT_MARKER_ID]}})
+    # Oznaka se upisuje zadnja - read_facets koristi brojače tek kad su potpuni
+    collection.replace_one({'_id': BUILT_MARKER_ID}, {'_id': BUILT_MARKER_ID, 'built_at': datetime.now()},
+                           upsert=True)
+    return len(counters)
@@ -0,0 +1,299 @@
+import io
+
+from flask import Response, current_app, request
+from gridfs.errors import NoFile
+from pymongo.errors import PyMongoError
+from werkzeug.wsgi import FileWrapper
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow nije instaliran - slike se spremaju bez varijanti
+    Image = None
+
+# Slika se nikad ne mijenja (nova slika dobiva novi _id) pa se smije keširati "zauvijek"
+IMAGE_MAX_AGE = 365 * 24 * 3600
+
+# Umanjene varijante slika: naziv -> najveće dimenzije (širina, visina)
+IMAGE_VARIANTS = {
+    'card': (600, 400),
+    'detail': (1200, 900),
+    'avatar': (240, 240),
+}
+AD_IMAGE_VARIANTS = ('card', 'detail')
+PROFILE_IMAGE_VARIANTS = ('avatar',)
+
+# Formati u kojima se sprema svaka varijanta: format -> (Pillow format, content type)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+}
+VARIANT_QUALITY = 82
+
+# Potpisi (magic bytes) dozvoljenih formata - content type se ne preuzima od klijenta
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+SNIFF_BYTES = 16
+
+# Zadana najveća veličina slike ako IMAGE_MAX_BYTES nije postavljen
+DEFAULT_IMAGE_MAX_BYTES = 8 * 1024 * 1024
+
+
+class ImageUploadError(ValueError):
+    """Uploadana datoteka nije prihvatljiva slika (format ili veličina)"""
+
+
+def _encode_variant(image, size, pil_format):
+    """Umanjuje sliku na zadane dimenzije i vraća kodirane bajtove"""
+    variant = image.copy()
+    variant.thumbnail(size)
+    buffer = io.BytesIO()
+    variant.save(buffer, pil_format, quality=VARIANT_QUALITY)
+    return buffer.getvalue()
+
+
+def generate_variants(fs, image_id, variant_names):
+    """Generira umanjene varijante spremljene slike.
+
+    Vraća {naziv: {format: file_id}}; prazan rječnik ako Pillow nije
+    dostupan ili slika nije čitljiva (tada se uvijek servira original).
+    Format koji Pillow ne može kodirati (npr. WebP bez libwebp) se preskače,
+    a varijante se zapisuju tek kad su sve kodirane - ako upis ne uspije,
+    već zapisane se brišu.
+    """
+    if Image is None:
+        return {}
+    try:
+        with Image.open(fs.get(image_id)) as original:
+            image = ImageOps.exif_transpose(original)
+            if image.mode != 'RGB':
+                # JPEG ne podržava prozirnost - prozirne dijelove stavi na bijelu pozadinu
+                background = Image.new('RGB', image.size, 'white')
+                rgba = image.convert('RGBA')
+                background.paste(rgba, mask=rgba.getchannel('A'))
+                image = background
+            encoded = []
+            for name in variant_names:
+                for fmt, (pil_format, content_type) in VARIANT_FORMATS.items():
+                    try:
+                        data = _encode_variant(image, IMAGE_VARIANTS[name], pil_format)
+                    except (KeyError, OSError, ValueError):
+                        continue
+                    encoded.append((name, fmt, content_type, data))
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return {}
+
+    variants = {}
+    stored = []
+    try:
+        for name, fmt, content_type, data in encoded:
+            file_id = fs.put(
+                data,
+                filename=f"{image_id}-{name}.{fmt}",
+                content_type=content_type,
+                metadata={'variant_of': image_id, 'variant': name}
+            )
+            stored.append(file_id)
+            variants.setdefault(name, {})[fmt] = file_id
+    except PyMongoError:
+        _delete_files(fs, stored)
+        raise
+    return variants
+
+
+def _delete_files(fs, file_ids):
+    """Briše datoteke nedovršenog uploada (greška brisanja se ignorira - javlja se izvorna)"""
+    for file_id in file_ids:
+        try:
+            fs.delete(file_id)
+        except PyMongoError:
+            pass
+
+
+def sniff_image_type(header):
+    """Vraća content type prema prvim bajtovima datoteke ili None ako format nije dozvoljen"""
+    for signature, content_type in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return content_type
+    return None
+
+
+def format_size(num_bytes):
+    """Veličina za poruke korisniku - KB ispod 1 MB, inače MB na jednu decimalu"""
+    if num_bytes < 1024:
+        return f'{num_bytes} B'
+    if num_bytes < 1024 * 1024:
+        return f'{num_bytes // 1024} KB'
+    return f'{round(num_bytes / (1024 * 1024), 1):g} MB'
+
+
+def stream_to_gridfs(fs, stream, filename, max_bytes):
+    """Sprema stream u GridFS chunk po chunk (memorija ne ovisi o veličini datoteke).
+
+    Datoteka koja ne počinje potpisom slike odbija se prije ikakvog pisanja,
+    a ona koja prijeđe max_bytes prekida se i već zapisani chunkovi se brišu.
+    """
+    header = stream.read(SNIFF_BYTES)
+    content_type = sniff_image_type(header)
+    if content_type is None:
+        raise ImageUploadError('Datoteka nije podržana slika (JPG, PNG, GIF)')
+    
+    grid_in = fs.new_file(filename=filename, content_type=content_type)
+    try:
+        grid_in.write(header)
+        total = len(header)
+        while True:
+            chunk = stream.read(grid_in.chunk_size)
+            if not chunk:
+                break
+            total += len(chunk)
+            if total > max_bytes:
+                raise ImageUploadError(f'Slika smije imati najviše {format_size(max_bytes)}')
+            grid_in.write(chunk)
+    except BaseException:
+        grid_in.abort()
+        raise
+    grid_in.close()
+    return grid_in._id
+
+
+def store_image(db, fs, file, variant_names=()):
+    """Sprema uploadanu sliku u GridFS zajedno s varijantama.
+
+    Varijante se zapisuju u metadata originala (za get_image) i vraćaju se
+    kako bi se mogle spremiti i uz oglas/korisnika. Neispravna ili prevelika
+    slika podiže ImageUploadError.
+    """
+    max_bytes = current_app.config.get('IMAGE_MAX_BYTES', DEFAULT_IMAGE_MAX_BYTES)
+    image_id = stream_to_gridfs(fs, file.stream, file.filename, max_bytes)
+    variants = {}
+    try:
+        variants = generate_variants(fs, image_id, variant_names)
+        if variants:
+            db['fs.files'].update_one({'_id': image_id}, {'$set': {'metadata.variants': variants}})
+    except PyMongoError:
+        # Neuspjeli upload se povlači u cijelosti - inače ostaju datoteke koje nitko ne referencira
+        _delete_files(fs, [file_id for formats in variants.values() for file_id in formats.values()])
+        _delete_files(fs, [image_id])
+        raise
+    return image_id, variants
+
+
+def delete_image(fs, image_id):
+    """Briše sliku i sve njezine varijante iz GridFS-a (i iz cachea slika svih procesa)"""
+    # Lokalni import - modul koristi i add_test_data.py izvan paketa
+    from .invalidation import publish_invalidation
+
+    cache = current_app.config.get('IMAGE_CACHE')
+    if cache is not None:
+        cache.delete_where(lambda key: key[0] == str(image_id))
+    publish_invalidation('image', image_id)
+    for variant in fs.find({'metadata.variant_of': image_id}):
+        fs.delete(variant._id)
+    fs.delete(image_id)
+
+
+def accepts_webp():
+    """Provjerava je li klijent eksplicitno naveo image/webp u Accept zaglavlju"""
+    return any(mimetype == 'image/webp' and quality > 0 for mimetype, quality in request.accept_mimetypes)
+
+
+def select_variant(grid_out, size):
+    """Vraća _id varijante za zadanu veličinu i Accept zaglavlje (ili None za original)"""
+    variants = ((grid_out.metadata or {}).get('variants') or {}).get(size)
+    if not variants:
+        return None
+    if 'webp' in variants and accepts_webp():
+        return variants['webp']
+    return variants.get('jpeg')
+
+
+def open_image(fs, image_id, size=None):
+    """Otvara original ili varijantu slike; varijanta koja ne postoji daje original"""
+    grid_out = fs.get(image_id)
+    if size:
+        variant_id = select_variant(grid_out, size)
+        if variant_id is not None:
+            try:
+                grid_out = fs.get(variant_id)
+            except NoFile:
+                pass
+    return grid_out
+
+
+class CachedImage:
+    """Slika (ili varijanta) spremljena u memoriji procesa"""
+
+    __slots__ = ('_id', 'content_type', 'length', 'upload_date', 'data')
+
+    def __init__(self, grid_out):
+        self._id = grid_out._id
+        self.content_type = grid_out.content_type
+        self.length = grid_out.length
+        self.upload_date = grid_out.upload_date
+        self.data = grid_out.read()
+
+
+def image_cache_key(image_id, size=None):
+    """Ključ cachea: (_id originala, varijanta, WebP) - isti URL može dati različite datoteke"""
+    return (str(image_id), size or '', bool(size) and accepts_webp())
+
+
+def image_etag(image):
+    """Jaki ETag slike - _id GridFS datoteke jednoznačno određuje sadržaj"""
+    return str(image._id)
+
+
+def _set_validators(response, image, vary_accept):
+    """Validatori i cache zaglavlja slike (samo iz metapodataka, bez sadržaja)"""
+    response.set_etag(image_etag(image))
+    response.last_modified = image.upload_date
+    response.cache_control.public = True
+    response.cache_control.max_age = IMAGE_MAX_AGE
+    response.cache_control.immutable = True
+    if vary_accept:
+        response.vary.add('Accept')
+    return response
+
+
+def image_not_modified(image, vary_accept=False):
+    """304 ako klijent već ima sliku (If-None-Match ili If-Modified-Since), inače None.
+
+    Odlučuje se na metapodacima iz fs.files, prije čitanja ijednog chunka.
+    """
+    if not (request.if_none_match or request.if_modified_since):
+        return None
+    response = _set_validators(Response(), image, vary_accept)
+    response.make_conditional(request)
+    return response if response.status_code == 304 else None
+
+
+def _send_image(body, image, vary_accept, direct_passthrough):
+    """Zajednička zaglavlja za sliku iz GridFS-a ili iz cachea"""
+    response = Response(
+        body,
+        mimetype=image.content_type or 'application/octet-stream',
+        direct_passthrough=direct_passthrough
+    )
+    response.content_length = image.length
+    response.accept_ranges = 'bytes'
+    _set_validators(response, image, vary_accept)
+    return response.make_conditional(request, accept_ranges=True, complete_length=image.length)
+
+
+def send_grid_file(grid_out, vary_accept=False):
+    """Vraća GridFS datoteku kao stream po chunkovima.
+
+    Podržava Range zahtjeve (seek unutar GridFS-a), a na If-None-Match /
+    If-Modified-Since odgovara s 304 bez čitanja ijednog chunka.
+    """
+    body = FileWrapper(grid_out, buffer_size=grid_out.chunk_size)
+    return _send_image(body, grid_out, vary_accept, direct_passthrough=True)
+
+
+def send_cached_image(image, vary_accept=False):
+    """Vraća sliku iz memorije (Range i uvjetni GET rade kao i za GridFS)"""
+    return _send_image(image.data, image, vary_accept, direct_passthrough=False)
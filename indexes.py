@@ -0,0 +1,129 @@
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure
+
+from .search import FIELD_WEIGHTS
+from .utils import keyset_filter
+
+# Listanje je sortirano po (created_at, _id) zbog keyset paginacije
+LISTING_SORT = [('created_at', DESCENDING), ('_id', DESCENDING)]
+
+# Lista po popularnosti (sort=popular) je sortirana po (views, _id)
+POPULAR_SORT = [('views', DESCENDING), ('_id', DESCENDING)]
+
+# Izvoz za sinkronizaciju je sortiran uzlazno po (updated_at, _id)
+SYNC_SORT = [('updated_at', ASCENDING), ('_id', ASCENDING)]
+
+# Indeksi koje aplikacija očekuje (kolekcija -> lista IndexModel objekata)
+INDEXES = {
+    'ads': [
+        IndexModel(LISTING_SORT, name='created_at_id_desc'),
+        IndexModel([('category', ASCENDING)] + LISTING_SORT, name='category_created_at_id'),
+        IndexModel([('user_id', ASCENDING)] + LISTING_SORT, name='user_created_at_id'),
+        IndexModel(POPULAR_SORT, name='views_id_desc'),
+        IndexModel([('category', ASCENDING)] + POPULAR_SORT, name='category_views_id'),
+        # Izvoz (/api/ads) po watermarku (updated_at, _id) i validator (ETag) liste - najnoviji updated_at
+        IndexModel(SYNC_SORT, name='updated_at_id'),
+        IndexModel([('category', ASCENDING)] + SYNC_SORT, name='category_updated_at_id'),
+        # Polja su već analizirana (search.py) pa MongoDB ne radi vlastiti stemming
+        IndexModel([(f'search.{field}', TEXT) for field in FIELD_WEIGHTS], name='search_text',
+                   weights={f'search.{field}': weight for field, weight in FIELD_WEIGHTS.items()},
+                   default_language='none'),
+    ],
+    'fs.files': [
+        IndexModel([('metadata.variant_of', ASCENDING)], name='variant_of', sparse=True),
+    ],
+    'ads_search_terms': [
+        IndexModel([('term', ASCENDING), ('category', ASCENDING)], name='term_category'),
+        IndexModel([('ad_id', ASCENDING)], name='ad_id'),
+    ],
+    'users': [
+        IndexModel([('username', ASCENDING)], name='username_unique', unique=True),
+        IndexModel([('email', ASCENDING)], name='email_unique', unique=True),
+    ],
+}
+
+# Zastarjeli indeksi koje su zamijenili gornji (kolekcija -> imena)
+OBSOLETE_INDEXES = {
+    'ads': ['created_at_desc', 'category_created_at', 'user_created_at', 'updated_at_desc', 'category_updated_at'],
+}
+
+# Oblici upita koje rute šalju bazi: (naziv, kolekcija, filter, sort, limit)
+QUERY_SHAPES = [
+    ('main.index', 'ads', {}, [('created_at', DESCENDING)], 6),
+    ('ads.ads', 'ads', {}, LISTING_SORT, 13),
+    ('ads.ads (kategorija)', 'ads', {'category': 'Elektronika'}, LISTING_SORT, 13),
+    ('ads.ads (cursor)', 'ads', keyset_filter(datetime.now(), ObjectId()), LISTING_SORT, 13),
+    ('ads.ads (kategorija, cursor)', 'ads',
+     {'category': 'Elektronika', **keyset_filter(datetime.now(), ObjectId())}, LISTING_SORT, 13),
+    ('ads.my_ads', 'ads', {'user_id': ObjectId()}, LISTING_SORT, 13),
+    ('ads.ads (popularni)', 'ads', {}, POPULAR_SORT, 13),
+    ('ads.ads (popularni, kategorija, cursor)', 'ads',
+     {'category': 'Elektronika', **keyset_filter(10, ObjectId(), 'views')}, POPULAR_SORT, 13),
+    ('ads.ads (validator)', 'ads', {}, [('updated_at', DESCENDING)], 1),
+    ('ads.ads (validator, kategorija)', 'ads', {'category': 'Elektronika'}, [('updated_at', DESCENDING)], 1),
+    ('api.ads', 'ads', {'updated_at': {'$type': 'date'}}, SYNC_SORT, 0),
+    ('api.ads (watermark)', 'ads', keyset_filter(datetime.now(), ObjectId(), 'updated_at', before=True), SYNC_SORT, 0),
+    ('api.ads (kategorija, watermark)', 'ads',
+     {'category': 'Elektronika', **keyset_filter(datetime.now(), ObjectId(), 'updated_at', before=True)}, SYNC_SORT, 0),
+    ('User.get_by_username', 'users', {'username': 'korisnik'}, None, 1),
+    ('User.get_by_email', 'users', {'email': 'korisnik@example.com'}, None, 1),
+]
+
+# Faze plana izvršavanja koje znače da upit nije pokriven indeksom
+FORBIDDEN_STAGES = ('COLLSCAN', 'SORT')
+
+
+def ensure_indexes(db):
+    """Kreira sve deklarirane indekse (idempotentno) i vraća njihova imena"""
+    for collection_name, names in OBSOLETE_INDEXES.items():
+        for name in names:
+            try:
+                db[collection_name].drop_index(name)
+            except OperationFailure:
+                pass  # Indeks ne postoji
+    
+    created = []
+    for collection_name, models in INDEXES.items():
+        created.extend(db[collection_name].create_indexes(models))
+    return created
+
+
+def _plan_stages(plan):
+    """Rekurzivno skuplja nazive faza iz explain plana"""
+    stages = []
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(plan['stage'])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+
+def explain_query_shape(db, collection_name, query, sort=None, limit=0):
+    """Vraća faze pobjedničkog plana za zadani oblik upita"""
+    cursor = db[collection_name].find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    if limit:
+        cursor = cursor.limit(limit)
+    explain = cursor.explain()
+    return _plan_stages(explain.get('queryPlanner', {}).get('winningPlan', {}))
+
+
+def verify_indexes(db, shapes=None):
+    """Provjerava da niti jedan oblik upita ne završava na COLLSCAN ili SORT fazi.
+
+    Vraća listu (naziv, faze, ispravno) za svaki oblik upita.
+    """
+    results = []
+    for name, collection_name, query, sort, limit in (shapes or QUERY_SHAPES):
+        stages = explain_query_shape(db, collection_name, query, sort, limit)
+        ok = not any(stage in FORBIDDEN_STAGES for stage in stages)
+        results.append((name, stages, ok))
+    return results
@@ -0,0 +1,218 @@
+import atexit
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timezone
+
+from flask import current_app
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+from .signals import ad_changed
+
+# Capped kolekcija s događajima invalidacije (najstariji se automatski prepisuju)
+EVENTS_COLLECTION = 'cache_invalidations'
+
+# Polja oglasa u događaju - dovoljna za handlere ad_changed (brojači, stranice)
+AD_EVENT_FIELDS = ('_id', 'category', 'user_id', 'price')
+
+BACKENDS = ('capped', 'changestream')
+
+
+def _slim_ad(ad):
+    return {field: ad[field] for field in AD_EVENT_FIELDS if field in ad} if ad else None
+
+
+class InvalidationBus:
+    """Invalidacija cacheva između procesa i hostova preko MongoDB-a.
+
+    Svaka promjena (oglas, korisnik, slika) upisuje se kao mali događaj u
+    capped kolekciju, a svaki proces u pozadinskoj niti čita nove događaje
+    tailable await cursorom (ili change streamom kad je baza replica set) i
+    primjenjuje ih na svoje cacheve u roku od nekoliko milisekundi. Vlastiti
+    događaji se preskaču jer su u procesu već primijenjeni. Nit se pokreće
+    lijeno, pri prvom zahtjevu u procesu (kao klijent u MongoConnection).
+    """
+
+    def __init__(self, app, mongo, backend='capped', size=1024 * 1024, retry_delay=0.5):
+        if backend not in BACKENDS:
+            raise ValueError(f"Nepoznata sabirnica invalidacije: {backend} ({', '.join(BACKENDS)})")
+        self.app = app
+        self.mongo = mongo
+        self.backend = backend
+        self.size = size
+        self.retry_delay = retry_delay
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._pid = None
+        self._origin = None
+        self._thread = None
+        self._counters = {'published': 0, 'publish_failures': 0, 'received': 0, 'applied': 0,
+                          'reconnects': 0, 'last_lag_ms': 0.0}
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    @property
+    def collection(self):
+        return self.mongo.collection(EVENTS_COLLECTION)
+
+    def _ensure_collection(self):
+        """Kreira capped kolekciju ako ne postoji (insert u nepostojeću bi kreirao običnu)"""
+        try:
+            self.mongo.db.create_collection(EVENTS_COLLECTION, capped=True, size=self.size)
+        except CollectionInvalid:
+            return
+        # Tailable cursor nad praznom kolekcijom odmah završava
+        self.collection.insert_one({'kind': 'init', 'origin': None})
+
+    def start(self):
+        """Pokreće čitanje događaja u ovom procesu (jednom po procesu, sigurno nakon fork-a)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._origin = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+            try:
+                self._ensure_collection()
+            except PyMongoError as e:
+                self.app.logger.warning(f"Sabirnica invalidacije nije dostupna: {e}")
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='cache-invalidation', daemon=True)
+            self._thread.start()
+            if self._pid is None:
+                atexit.register(self.stop)
+            self._pid = os.getpid()
+
+    def stop(self):
+        self._stopped.set()
+
+    def publish(self, kind, **payload):
+        """Objavljuje događaj ostalim procesima; greška se samo logira (lokalni cache je već ažuran)"""
+        self.start()
+        event = {'kind': kind, 'origin': self._origin, 'at': datetime.now(timezone.utc), **payload}
+        try:
+            self.collection.insert_one(event)
+        except PyMongoError as e:
+            self._count('publish_failures')
+            self.app.logger.warning(f"Objava invalidacije ({kind}) nije uspjela: {e}")
+            return
+        self._count('published')
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats['running'] = int(self._thread is not None and self._thread.is_alive() and self._pid == os.getpid())
+        return stats
+
+    def _run(self):
+        """Petlja čitanja - nakon greške ili zatvorenog cursora ponovno se spaja"""
+        with self.app.app_context():
+            last_id = self._newest_id()
+            resume_token = None
+            while not self._stopped.is_set():
+                try:
+                    if self.backend == 'changestream':
+                        resume_token = self._watch(resume_token)
+                    else:
+                        last_id = self._tail(last_id)
+                except PyMongoError as e:
+                    self._count('reconnects')
+                    self.app.logger.warning(f"Čitanje invalidacija prekinuto: {e}")
+                self._stopped.wait(self.retry_delay)
+
+    def _newest_id(self):
+        try:
+            newest = self.collection.find_one({}, {'_id': 1}, sort=[('$natural', -1)])
+        except PyMongoError:
+            return None
+        return newest['_id'] if newest else None
+
+    def _tail(self, last_id):
+        """Tailable await cursor nad capped kolekcijom; vraća _id zadnjeg pročitanog događaja.
+
+        Cursor uvijek kreće od početka kolekcije (prirodni redoslijed upisa), pa
+        se događaji do zadnjeg pročitanog preskaču - _id nije monoton između
+        hostova pa se ne može koristiti kao filter.
+        """
+        skipping = last_id is not None and self.collection.find_one({'_id': last_id}, {'_id': 1}) is not None
+        cursor = self.collection.find({}, cursor_type=CursorType.TAILABLE_AWAIT).max_await_time_ms(1000)
+        try:
+            while cursor.alive and not self._stopped.is_set():
+                for event in cursor:
+                    if skipping:
+                        skipping = event['_id'] != last_id
+                        continue
+                    last_id = event['_id']
+                    self._apply(event)
+        finally:
+            cursor.close()
+        return last_id
+
+    def _watch(self, resume_token):
+        """Change stream insertova u kolekciju događaja; vraća token za nastavak"""
+        pipeline = [{'$match': {'operationType': 'insert'}}]
+        with self.collection.watch(pipeline, resume_after=resume_token, max_await_time_ms=1000) as stream:
+            while stream.alive and not self._stopped.is_set():
+                change = stream.try_next()
+                if change is not None:
+                    self._apply(change['fullDocument'])
+                resume_token = stream.resume_token or resume_token
+        return resume_token
+
+    def _apply(self, event):
+        """Primjenjuje tuđi događaj na cacheve ovog procesa"""
+        if event.get('origin') in (None, self._origin):
+            return
+        self._count('received')
+        handler = APPLY.get(event.get('kind'))
+        if handler is None:
+            return
+        try:
+            handler(self.app, event)
+        except Exception as e:
+            self.app.logger.error(f"Primjena invalidacije {event.get('kind')} nije uspjela: {e}")
+            return
+        self._count('applied')
+        if event.get('at'):
+            at = event['at'].replace(tzinfo=timezone.utc)
+            lag_ms = (datetime.now(timezone.utc) - at).total_seconds() * 1000
+            with self._lock:
+                self._counters['last_lag_ms'] = round(lag_ms, 3)
+
+
+def _apply_ad(app, event):
+    # Handleri koji pišu u bazu (brojači faceta) preskaču remote događaje
+    ad_changed.send(app, old=event.get('old'), new=event.get('new'), remote=True)
+
+
+def _apply_user(app, event):
+    cache = app.config.get('USER_CACHE')
+    if cache is not None:
+        cache.delete(event['key'])
+
+
+def _apply_image(app, event):
+    cache = app.config.get('IMAGE_CACHE')
+    if cache is not None:
+        cache.delete_where(lambda key: key[0] == event['key'])
+
+
+APPLY = {'ad': _apply_ad, 'user': _apply_user, 'image': _apply_image}
+
+
+def publish_invalidation(kind, key):
+    """Objavljuje invalidaciju korisnika/slike ostalim procesima (ako je sabirnica uključena)"""
+    bus = current_app.config.get('INVALIDATION_BUS')
+    if bus is not None:
+        bus.publish(kind, key=str(key))
+
+
+def publish_ad_changed(sender, old=None, new=None, remote=False):
+    """ad_changed handler - prosljeđuje promjenu oglasa ostalim procesima"""
+    bus = sender.config.get('INVALIDATION_BUS')
+    if bus is not None and not remote:
+        bus.publish('ad', old=_slim_ad(old), new=_slim_ad(new))
@@ -0,0 +1,150 @@
+import atexit
+import queue
+import smtplib
+import threading
+import time
+from contextlib import ExitStack
+
+# Oznaka kojom se radnik zaustavlja
+_STOP = object()
+
+
+class EmailDispatcher:
+    """Ograničeni red za slanje emailova s fiksnim brojem radnika.
+
+    Svaki radnik drži otvorenu SMTP vezu i kroz nju šalje više poruka; veza
+    se zatvara nakon idle_timeout sekundi bez poruka ili nakon
+    max_per_connection poruka. Neuspjela slanja se ponavljaju s
+    eksponencijalnim odmakom, a kad je red pun submit() odmah vraća False.
+
+    connect je funkcija koja vraća context manager s metodom send(msg)
+    (zadano Flask-Mail mail.connect), pa se dispatcher može testirati i
+    protiv lokalnog SMTP servera ili zamjenske veze u istom procesu.
+    """
+
+    def __init__(self, app, workers=2, queue_size=1000, max_retries=3, backoff=1.0,
+                 idle_timeout=30.0, max_per_connection=100, connect=None):
+        self.app = app
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.idle_timeout = idle_timeout
+        self.max_per_connection = max_per_connection
+        self._connect = connect or (lambda: app.extensions['mail'].connect())
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._counters = {
+            'submitted': 0, 'sent': 0, 'failed': 0, 'retried': 0, 'rejected': 0,
+            'connections_opened': 0, 'queue_wait_total': 0.0,
+        }
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def start(self):
+        """Pokreće radnike (lijeno, kod prve poruke - tako su niti uvijek nakon fork-a)"""
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'email-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        atexit.register(self.shutdown)
+
+    def submit(self, msg):
+        """Stavlja poruku u red; vraća False ako je red pun (backpressure)"""
+        self.start()
+        try:
+            self._queue.put_nowait((msg, time.monotonic()))
+        except queue.Full:
+            self._count('rejected')
+            return False
+        self._count('submitted')
+        return True
+
+    def shutdown(self, timeout=10.0):
+        """Šalje preostale poruke i zaustavlja radnike (najviše timeout sekundi i kad je red pun)"""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        deadline = time.monotonic() + timeout
+        for _ in threads:
+            try:
+                self._queue.put((_STOP, None), timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                # Radnici ne prazne red - izlaz iz procesa ne smije čekati (niti su daemon)
+                break
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+    def stats(self):
+        """Brojači i trenutna dubina reda"""
+        with self._lock:
+            stats = dict(self._counters)
+        stats['queued'] = self._queue.qsize()
+        stats['queue_capacity'] = self._queue.maxsize
+        # Samo živi radnici (mrtvi radnik ne prazni red)
+        stats['workers'] = sum(thread.is_alive() for thread in self._threads)
+        return stats
+
+    def _run(self):
+        """Petlja radnika - jedna SMTP veza za više uzastopnih poruka"""
+        with self.app.app_context():
+            connection = None
+            stack = None
+            sent_on_connection = 0
+            while True:
+                try:
+                    msg, queued_at = self._queue.get(timeout=self.idle_timeout)
+                except queue.Empty:
+                    # Nema poruka - ne drži vezu otvorenom
+                    connection, stack = self._close(stack)
+                    continue
+                if msg is _STOP:
+                    self._close(stack)
+                    self._queue.task_done()
+                    return
+                self._count('queue_wait_total', time.monotonic() - queued_at)
+
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        if connection is None:
+                            stack = ExitStack()
+                            connection = stack.enter_context(self._connect())
+                            sent_on_connection = 0
+                            self._count('connections_opened')
+                        connection.send(msg)
+                        sent_on_connection += 1
+                        self._count('sent')
+                        break
+                    except (smtplib.SMTPException, OSError) as e:
+                        connection, stack = self._close(stack)
+                        if attempt == self.max_retries:
+                            self._count('failed')
+                            self.app.logger.error(f"Slanje emaila nije uspjelo ({getattr(msg, 'recipients', None)}): {e}")
+                        else:
+                            self._count('retried')
+                            time.sleep(self.backoff * 2 ** attempt)
+                    except Exception as e:
+                        # Greška same poruke (npr. bez primatelja, kodiranje) - ponavljanje ne pomaže, a
+                        # radnik mora preživjeti; veza je možda u pola naredbe pa se zatvara
+                        connection, stack = self._close(stack)
+                        self._count('failed')
+                        self.app.logger.exception(f"Slanje emaila nije uspjelo ({getattr(msg, 'recipients', None)}): {e}")
+                        break
+                self._queue.task_done()
+
+                if sent_on_connection >= self.max_per_connection:
+                    connection, stack = self._close(stack)
+
+    @staticmethod
+    def _close(stack):
+        """Zatvara SMTP vezu (greške pri zatvaranju pokvarene veze se ignoriraju)"""
+        if stack is not None:
+            try:
+                stack.close()
+            except Exception:
+                pass
+        return None, None
@@ -1,11 +1,16 @@
 from flask import render_template, current_app
 from . import bp
+from ..cache import cached_page
+from ..ads.projections import CARD_PROJECTION
+from ..utils import ensure_excerpts
 
 @bp.route('/')
+@cached_page
 def index():
     """Početna stranica"""
     ads_collection = current_app.config['ADS_COLLECTION']
-    recent_ads = ads_collection.find().sort('created_at', -1).limit(6)
-    total_ads = ads_collection.count_documents({})
+    recent_ads = ensure_excerpts(list(ads_collection.find({}, CARD_PROJECTION).sort('created_at', -1).limit(6)),
+                                 ads_collection)
+    total_ads = current_app.config['AD_COUNTER'].count(current_app.config['DB'])
     
     return render_template('index.html', ads=recent_ads, total_ads=total_ads)
@@ -0,0 +1,278 @@
+import threading
+import time
+from collections import Counter
+
+import bson
+from flask import Response, current_app, request
+from pymongo import monitoring
+
+# Granice histograma latencije zahtjeva (sekunde)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Najviše naredbi koje se pamte po zahtjevu za log sporih zahtjeva
+MAX_BREAKDOWN = 50
+
+# Stanje zahtjeva koji se trenutno obrađuje u ovoj niti
+_local = threading.local()
+
+
+class RequestStats:
+    """MongoDB naredbe jednog zahtjeva (broj, vrijeme u bazi, primljeni bajtovi)"""
+
+    __slots__ = ('started', 'commands', 'db_seconds', 'reply_bytes', 'breakdown', 'pending')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.commands = 0
+        self.db_seconds = 0.0
+        self.reply_bytes = 0
+        self.breakdown = []
+        self.pending = {}
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Pripisuje MongoDB naredbe zahtjevu koji ih je poslao.
+
+    Pymongo poziva listener u niti koja izvršava naredbu, a to je (za
+    sinkroni klijent) upravo nit koja obrađuje zahtjev. Naredbe izvan
+    zahtjeva (CLI, email radnici) broje se pod praznim endpointom.
+
+    Veličina odgovora se mjeri samo uz reply_bytes=True: zahtijeva ponovno
+    kodiranje svakog odgovora (i chunkova slika) u niti zahtjeva.
+    """
+
+    def __init__(self, metrics, reply_bytes=False):
+        self.metrics = metrics
+        self.reply_bytes = reply_bytes
+
+    def started(self, event):
+        stats = getattr(_local, 'stats', None)
+        if stats is not None:
+            collection = event.command.get(event.command_name)
+            stats.pending[event.request_id] = collection if isinstance(collection, str) else ''
+
+    def succeeded(self, event):
+        self._finish(event, len(bson.encode(event.reply)) if self.reply_bytes else 0, failed=False)
+
+    def failed(self, event):
+        self._finish(event, 0, failed=True)
+
+    def _finish(self, event, reply_bytes, failed):
+        seconds = event.duration_micros / 1e6
+        stats = getattr(_local, 'stats', None)
+        if stats is None:
+            self.metrics.observe_command('', event.command_name, seconds, reply_bytes, failed)
+            return
+        collection = stats.pending.pop(event.request_id, '')
+        stats.commands += 1
+        stats.db_seconds += seconds
+        stats.reply_bytes += reply_bytes
+        if len(stats.breakdown) < MAX_BREAKDOWN:
+            stats.breakdown.append((event.command_name, collection, seconds))
+        if failed:
+            self.metrics.observe_failure(request.endpoint or 'unmatched', event.command_name)
+
+
+def _escape(value):
+    """Escape vrijednosti labele u Prometheus tekstualnom formatu"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+class Metrics:
+    """Brojači i histogrami procesa u Prometheus tekstualnom formatu.
+
+    Svaki proces (npr. gunicorn radnik) ima vlastite brojače, pa Prometheus
+    treba dohvaćati svaki proces zasebno ili zbrajati po instanci.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._requests = Counter()          # (endpoint, method, status) -> broj
+        self._latency = {}                  # endpoint -> [brojači po granicama..., zbroj, broj]
+        self._commands = Counter()          # (endpoint, naredba) -> broj
+        self._command_seconds = Counter()   # (endpoint, naredba) -> sekunde
+        self._reply_bytes = Counter()       # endpoint -> bajtovi
+        self._command_failures = Counter()  # (endpoint, naredba) -> broj
+
+    def observe_request(self, endpoint, method, status, seconds, stats):
+        """Bilježi završeni zahtjev i njegove MongoDB naredbe"""
+        with self._lock:
+            self._requests[(endpoint, method, status)] += 1
+            histogram = self._latency.setdefault(endpoint, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[i] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+            for command, _, command_seconds in stats.breakdown:
+                self._commands[(endpoint, command)] += 1
+                self._command_seconds[(endpoint, command)] += command_seconds
+            # Naredbe iznad MAX_BREAKDOWN ulaze samo u ukupni zbroj
+            missing = stats.commands - len(stats.breakdown)
+            if missing > 0:
+                self._commands[(endpoint, 'other')] += missing
+            self._reply_bytes[endpoint] += stats.reply_bytes
+
+    def observe_command(self, endpoint, command, seconds, reply_bytes, failed=False):
+        """Bilježi naredbu poslanu izvan zahtjeva"""
+        with self._lock:
+            self._commands[(endpoint, command)] += 1
+            self._command_seconds[(endpoint, command)] += seconds
+            self._reply_bytes[endpoint] += reply_bytes
+            if failed:
+                self._command_failures[(endpoint, command)] += 1
+
+    def observe_failure(self, endpoint, command):
+        """Bilježi neuspjelu naredbu zahtjeva"""
+        with self._lock:
+            self._command_failures[(endpoint, command)] += 1
+
+    def render(self, gauges=()):
+        """Vraća sve metrike u Prometheus tekstualnom formatu (gauges: (naziv, pomoć, vrijednost))"""
+        with self._lock:
+            requests = dict(self._requests)
+            latency = {endpoint: list(values) for endpoint, values in self._latency.items()}
+            commands = dict(self._commands)
+            command_seconds = dict(self._command_seconds)
+            reply_bytes = dict(self._reply_bytes)
+            failures = dict(self._command_failures)
+
+        lines = [
+            '# HELP http_requests_total Broj obrađenih HTTP zahtjeva',
+            '# TYPE http_requests_total counter',
+        ]
+        for (endpoint, method, status), n in sorted(requests.items()):
+            lines.append(f'http_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {n}')
+
+        lines += [
+            '# HELP http_request_duration_seconds Trajanje obrade HTTP zahtjeva',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        for endpoint, values in sorted(latency.items()):
+            for bound, n in zip(self.buckets, values):
+                lines.append(f'http_request_duration_seconds_bucket{_labels(endpoint=endpoint, le=bound)} {n}')
+            lines.append(f'http_request_duration_seconds_bucket{_labels(endpoint=endpoint, le="+Inf")} {values[-1]}')
+            lines.append(f'http_request_duration_seconds_sum{_labels(endpoint=endpoint)} {values[-2]:.6f}')
+            lines.append(f'http_request_duration_seconds_count{_labels(endpoint=endpoint)} {values[-1]}')
+
+        lines += [
+            '# HELP mongodb_commands_total Broj MongoDB naredbi po endpointu',
+            '# TYPE mongodb_commands_total counter',
+        ]
+        for (endpoint, command), n in sorted(commands.items()):
+            lines.append(f'mongodb_commands_total{_labels(endpoint=endpoint, command=command)} {n}')
+
+        lines += [
+            '# HELP mongodb_command_seconds_total Ukupno trajanje MongoDB naredbi po endpointu',
+            '# TYPE mongodb_command_seconds_total counter',
+        ]
+        for (endpoint, command), seconds in sorted(command_seconds.items()):
+            lines.append(f'mongodb_command_seconds_total{_labels(endpoint=endpoint, command=command)} {seconds:.6f}')
+
+        lines += [
+            '# HELP mongodb_command_failures_total Broj neuspjelih MongoDB naredbi',
+            '# TYPE mongodb_command_failures_total counter',
+        ]
+        for (endpoint, command), n in sorted(failures.items()):
+            lines.append(f'mongodb_command_failures_total{_labels(endpoint=endpoint, command=command)} {n}')
+
+        lines += [
+            '# HELP mongodb_reply_bytes_total Bajtovi primljeni od MongoDB-a po endpointu',
+            '# TYPE mongodb_reply_bytes_total counter',
+        ]
+        for endpoint, n in sorted(reply_bytes.items()):
+            lines.append(f'mongodb_reply_bytes_total{_labels(endpoint=endpoint)} {n}')
+
+        for name, help_text, value in gauges:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge', f'{name} {value}']
+        return '\n'.join(lines) + '\n'
+
+
+def _component_gauges(app):
+    """Stanje poola konekcija, cacheva, email reda i hashiranja lozinki kao gauge metrike"""
+    gauges = []
+    mongo = app.config.get('MONGO')
+    if mongo is not None:
+        for key, value in mongo.pool_stats().items():
+            gauges.append((f'mongodb_pool_{key}', f'Pool MongoDB konekcija: {key}', value))
+    image_cache = app.config.get('IMAGE_CACHE')
+    if image_cache is not None:
+        for key, value in image_cache.stats().items():
+            gauges.append((f'image_cache_{key}', f'Cache slika: {key}', value))
+    dispatcher = app.config.get('EMAIL_DISPATCHER')
+    if dispatcher is not None:
+        for key, value in dispatcher.stats().items():
+            gauges.append((f'email_{key}', f'Red za slanje emailova: {key}', value))
+    bus = app.config.get('INVALIDATION_BUS')
+    if bus is not None:
+        for key, value in bus.stats().items():
+            gauges.append((f'cache_invalidation_{key}', f'Sabirnica invalidacije cacheva: {key}', value))
+    view_counter = app.config.get('VIEW_COUNTER')
+    if view_counter is not None:
+        for key, value in view_counter.stats().items():
+            gauges.append((f'ad_views_{key}', f'Brojač pregleda oglasa: {key}', value))
+    hasher = app.config.get('PASSWORD_HASHER')
+    if hasher is not None:
+        for key, value in hasher.stats().items():
+            gauges.append((f'password_hash_{key}', f'Pool za hashiranje lozinki: {key}', value))
+    for name in ('AUTH_IP_LIMITER', 'AUTH_USER_LIMITER'):
+        limiter = app.config.get(name)
+        if limiter is not None:
+            for key, value in limiter.stats().items():
+                gauges.append((f'{name.lower()}_{key}', f'Limit prijave/registracije: {key}', value))
+    return gauges
+
+
+def _start_request():
+    _local.stats = RequestStats()
+
+
+def _finish_request(response):
+    """Bilježi trajanje i naredbe zahtjeva; spori zahtjevi se logiraju s popisom naredbi.
+
+    Chunkovi slika koji se streamaju nakon povratka iz viewa ne ulaze u zahtjev.
+    """
+    stats = getattr(_local, 'stats', None)
+    if stats is None:
+        return response
+    _local.stats = None
+    seconds = time.perf_counter() - stats.started
+    endpoint = request.endpoint or 'unmatched'
+    current_app.config['METRICS'].observe_request(endpoint, request.method, response.status_code, seconds, stats)
+
+    slow_ms = current_app.config['SLOW_REQUEST_MS']
+    if slow_ms and seconds * 1000 >= slow_ms:
+        breakdown = ', '.join(f"{command} {collection} {command_seconds * 1000:.1f}ms"
+                              for command, collection, command_seconds in stats.breakdown)
+        current_app.logger.warning(
+            f"Spori zahtjev {request.method} {request.full_path} ({endpoint}): {seconds * 1000:.0f} ms, "
+            f"{stats.commands} MongoDB naredbi ({stats.db_seconds * 1000:.1f} ms"
+            + (f", {stats.reply_bytes} B)" if stats.reply_bytes else ')')
+            + (f": {breakdown}" if breakdown else '')
+        )
+    return response
+
+
+def _discard_request(exc=None):
+    # Zahtjev koji nije stigao do after_request (npr. prekinut) ne smije ostaviti stanje u niti
+    _local.stats = None
+
+
+def metrics_view():
+    """Prometheus endpoint (/metrics)"""
+    app = current_app._get_current_object()
+    body = app.config['METRICS'].render(_component_gauges(app))
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+
+def register_metrics(app):
+    """Uključuje mjerenje zahtjeva i /metrics endpoint"""
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_discard_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,220 @@
+import re
+import unicodedata
+from collections import Counter
+
+from pymongo import DeleteMany, InsertOne
+
+# Težine polja pri rangiranju rezultata
+FIELD_WEIGHTS = {
+    'title': 10,
+    'category': 5,
+    'location': 3,
+    'description': 1,
+}
+
+# Česte riječi koje ne nose značenje (bez dijakritika)
+STOPWORDS = {
+    'a', 'ali', 'bi', 'ce', 'da', 'do', 'i', 'iz', 'je', 'kao', 'koja', 'koje', 'koji',
+    'na', 'ne', 'nije', 'o', 'od', 'ili', 'po', 's', 'sa', 'sam', 'se', 'su', 'ta',
+    'taj', 'te', 'to', 'u', 'uz', 'za',
+}
+
+# Nastavci koje skida jednostavni stemmer za hrvatski (najdulji prvi)
+SUFFIXES = sorted([
+    'ovima', 'evima', 'ijama', 'skoga', 'skome', 'skim', 'skih', 'skog', 'skom',
+    'ama', 'ima', 'ova', 'eva', 'ove', 'eve', 'ovi', 'evi', 'oga', 'ega', 'ome', 'emu',
+    'ski', 'ska', 'sko', 'ske', 'om', 'em', 'og', 'eg', 'oj', 'ih', 'im', 'iju',
+    'a', 'e', 'i', 'o', 'u',
+], key=len, reverse=True)
+
+MIN_STEM_LENGTH = 3
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def fold_diacritics(text):
+    """Uklanja dijakritičke znakove (č, ć -> c, š -> s, ž -> z, đ -> dj)"""
+    text = text.lower().replace('đ', 'dj')
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def stem(token):
+    """Skida najdulji poznati nastavak tako da ostane barem MIN_STEM_LENGTH znakova"""
+    if token.isdigit():
+        return token
+    for suffix in SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= MIN_STEM_LENGTH:
+            return token[:-len(suffix)]
+    return token
+
+
+def analyze(text):
+    """Pretvara tekst u listu korijena riječi (bez dijakritika i stop riječi)"""
+    if not text:
+        return []
+    tokens = _TOKEN_RE.findall(fold_diacritics(text))
+    return [stem(token) for token in tokens if len(token) > 1 and token not in STOPWORDS]
+
+
+def build_search_fields(ad):
+    """Analizirana polja oglasa koja se spremaju u ad['search'] za tekstualni indeks"""
+    return {field: ' '.join(analyze(ad.get(field) or '')) for field in FIELD_WEIGHTS}
+
+
+class TextSearchBackend:
+    """Pretraga preko MongoDB tekstualnog indeksa nad ad['search'] poljima"""
+
+    name = 'text'
+
+    def index_ad(self, db, ad):
+        """Tekstualni indeks održava sam MongoDB (dovoljno je spremiti ad['search'])"""
+
+    def remove_ad(self, db, ad_id):
+        """Tekstualni indeks održava sam MongoDB"""
+
+    def rebuild(self, db, ads):
+        """Nema zasebne strukture koju bi trebalo obnoviti"""
+
+    @staticmethod
+    def _text_query(query, text):
+        """Dodaje $text uvjet upitu ili vraća None ako tekst nema riječi za pretragu"""
+        terms = analyze(text)
+        if not terms:
+            return None
+        return {**query, '$text': {'$search': ' '.join(terms)}}
+
+    def search(self, db, query, text, skip, limit, projection=None):
+        """Vraća stranicu oglasa sortiranu po relevantnosti"""
+        full_query = self._text_query(query, text)
+        if full_query is None:
+            return []
+        cursor = db['ads'].find(full_query, {**(projection or {}), 'score': {'$meta': 'textScore'}})
+        cursor = cursor.sort([('score', {'$meta': 'textScore'}), ('_id', -1)]).skip(skip).limit(limit)
+        return list(cursor)
+
+    def match_stages(self, query, text):
+        """(kolekcija, faze agregacije) koje daju pogotke s category i price - za facete"""
+        full_query = self._text_query(query, text)
+        if full_query is None:
+            return None
+        return 'ads', [{'$match': full_query}]
+
+    def count(self, db, query, text):
+        """Vraća ukupan broj pogodaka"""
+        full_query = self._text_query(query, text)
+        if full_query is None:
+            return 0
+        return db['ads'].count_documents(full_query)
+
+
+class InvertedIndexSearchBackend:
+    """Pretraga preko aplikacijskog invertiranog indeksa (kolekcija ads_search_terms).
+
+    Za svaki par (korijen, oglas) postoji jedan dokument s težinom, pa upit
+    dira samo postinge traženih riječi, neovisno o veličini kataloga.
+    """
+
+    name = 'inverted'
+    collection_name = 'ads_search_terms'
+
+    @staticmethod
+    def _postings(ad):
+        """Generira postinge (korijen -> težina) za jedan oglas"""
+        weights = Counter()
+        for field, weight in FIELD_WEIGHTS.items():
+            for term in analyze(ad.get(field) or ''):
+                weights[term] += weight
+        return [
+            {'term': term, 'ad_id': ad['_id'], 'weight': weight, 'category': ad.get('category')}
+            for term, weight in weights.items()
+        ]
+
+    def index_ad(self, db, ad):
+        """(Ponovno) indeksira jedan oglas"""
+        terms_collection = db[self.collection_name]
+        terms_collection.delete_many({'ad_id': ad['_id']})
+        postings = self._postings(ad)
+        if postings:
+            terms_collection.insert_many(postings, ordered=False)
+
+    def remove_ad(self, db, ad_id):
+        """Briše postinge obrisanog oglasa"""
+        db[self.collection_name].delete_many({'ad_id': ad_id})
+
+    def rebuild(self, db, ads):
+        """Obnavlja postinge za zadane oglase jednim bulk_write pozivom"""
+        requests = []
+        for ad in ads:
+            requests.append(DeleteMany({'ad_id': ad['_id']}))
+            requests.extend(InsertOne(posting) for posting in self._postings(ad))
+        if requests:
+            db[self.collection_name].bulk_write(requests, ordered=True)
+
+    @staticmethod
+    def _match(query, text):
+        """$match faza nad postinzima ili None ako tekst nema riječi za pretragu"""
+        terms = list(dict.fromkeys(analyze(text)))
+        if not terms:
+            return None
+        match = {'term': {'$in': terms}}
+        if 'category' in query:
+            match['category'] = query['category']
+        return {'$match': match}
+
+    def search(self, db, query, text, skip, limit, projection=None):
+        """Vraća stranicu oglasa sortiranu po zbroju težina pogođenih riječi"""
+        match = self._match(query, text)
+        if match is None:
+            return []
+        pipeline = [
+            match,
+            {'$group': {'_id': '$ad_id', 'score': {'$sum': '$weight'}}},
+            {'$sort': {'score': -1, '_id': -1}},
+            {'$skip': skip},
+            {'$limit': limit},
+        ]
+        scores = {hit['_id']: hit['score'] for hit in db[self.collection_name].aggregate(pipeline)}
+        ads = {ad['_id']: ad for ad in db['ads'].find({**query, '_id': {'$in': list(scores)}}, projection)}
+        page = []
+        for ad_id, score in scores.items():
+            if ad_id in ads:
+                ads[ad_id]['score'] = score
+                page.append(ads[ad_id])
+        return page
+
+    def match_stages(self, query, text):
+        """(kolekcija, faze agregacije) koje daju pogotke s category i price - za facete"""
+        match = self._match(query, text)
+        if match is None:
+            return None
+        return self.collection_name, [
+            match,
+            {'$group': {'_id': '$ad_id'}},
+            {'$lookup': {'from': 'ads', 'localField': '_id', 'foreignField': '_id', 'as': 'ad'}},
+            {'$unwind': '$ad'},
+            {'$project': {'category': '$ad.category', 'price': '$ad.price'}},
+        ]
+
+    def count(self, db, query, text):
+        """Vraća ukupan broj pogodaka"""
+        match = self._match(query, text)
+        if match is None:
+            return 0
+        pipeline = [match, {'$group': {'_id': '$ad_id'}}, {'$count': 'n'}]
+        result = next(db[self.collection_name].aggregate(pipeline), None)
+        return result['n'] if result else 0
+
+
+SEARCH_BACKENDS = {
+    TextSearchBackend.name: TextSearchBackend,
+    InvertedIndexSearchBackend.name: InvertedIndexSearchBackend,
+}
+
+
+def get_search_backend(name):
+    """Vraća instancu pretraživača po imenu ('text' ili 'inverted')"""
+    try:
+        return SEARCH_BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Nepoznat pretraživač: {name}")
@@ -0,0 +1,8 @@
+from blinker import Namespace
+
+_signals = Namespace()
+
+# Oglas je kreiran, uređen ili obrisan.
+# Argumenti: old (dokument prije promjene ili None), new (dokument nakon promjene ili None),
+# remote (True za promjenu iz drugog procesa - dokumenti sadrže samo invalidation.AD_EVENT_FIELDS)
+ad_changed = _signals.signal('ad-changed')
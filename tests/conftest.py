@@ -0,0 +1,15 @@
+import mongomock
+import mongomock.gridfs
+import pytest
+
+from .. import create_app
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setenv('MONGODB_ENSURE_INDEXES', 'False')
+    monkeypatch.setenv('SEARCH_BACKEND', 'inverted')
+    monkeypatch.setenv('PASSWORD_HASH_WORKERS', '0')
+    monkeypatch.delenv('MONGODB_SECONDARY_READ_ENDPOINTS', raising=False)
+    mongomock.gridfs.enable_gridfs_integration()
+    return create_app('testing', mongo_client=mongomock.MongoClient())
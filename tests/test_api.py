@@ -0,0 +1,38 @@
+import json
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+
+def _export(client, **params):
+    response = client.get('/api/ads', query_string=params)
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_updated_since_rereads_overlap_window(app):
+    app.config['API_SYNC_OVERLAP_SECONDS'] = 60
+    ads = app.config['MONGO'].collection('ads')
+    watermark = datetime(2024, 5, 1, 12, 0, 0)
+    ads.insert_one({'_id': ObjectId(), 'title': 'sinkroniziran', 'updated_at': watermark})
+    # Upis s updated_at prije watermarka koji je postao vidljiv tek nakon prethodne sinkronizacije
+    late = ads.insert_one({'_id': ObjectId(), 'title': 'zakasnio', 'updated_at': watermark - timedelta(seconds=5)})
+    ads.insert_one({'_id': ObjectId(), 'title': 'star', 'updated_at': watermark - timedelta(hours=1)})
+
+    records = _export(app.test_client(), updated_since=watermark.isoformat())
+
+    assert [record['title'] for record in records] == ['zakasnio', 'sinkroniziran']
+    assert records[0]['_id'] == str(late.inserted_id)
+
+
+def test_after_resumes_without_overlap(app):
+    ads = app.config['MONGO'].collection('ads')
+    start = datetime(2024, 5, 1, 12, 0, 0)
+    ads.insert_many([{'_id': ObjectId(), 'title': str(i), 'updated_at': start + timedelta(seconds=i)}
+                     for i in range(3)])
+    client = app.test_client()
+
+    first = _export(client, limit=2)
+    rest = _export(client, after=first[-1]['cursor'], limit=2)
+
+    assert [record['title'] for record in first + rest] == ['0', '1', '2']
@@ -0,0 +1,28 @@
+import io
+
+from ..images import stream_to_gridfs
+from ..signals import ad_changed
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 64
+
+
+def test_anonymous_image_response_does_not_vary_on_cookie(app):
+    with app.app_context():
+        image_id = stream_to_gridfs(app.config['GRIDFS'], io.BytesIO(PNG), 'a.png', 1024)
+    client = app.test_client()
+
+    # Prvi zahtjev čita GridFS (usmjeren na sekundarni čvor), drugi dolazi iz cachea slika
+    for _ in range(2):
+        response = client.get(f'/image/{image_id}')
+        assert response.status_code == 200
+        assert 'Cookie' not in response.headers.get('Vary', '')
+        assert 'public' in response.headers['Cache-Control']
+
+
+def test_reads_go_to_primary_after_ad_change(app):
+    route = app.config['MONGO'].route
+    with app.test_request_context('/image/0'):
+        assert route() == 'secondary'
+        ad_changed.send(app, old=None, new={'_id': 1, 'category': 'auto'})
+        # Cachevi ispražnjeni promjenom pune se s primarnog čvora
+        assert route() is None
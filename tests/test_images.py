@@ -0,0 +1,54 @@
+import io
+
+import gridfs
+import mongomock
+import mongomock.gridfs
+import pytest
+from PIL import Image
+from pymongo.errors import AutoReconnect
+
+from .. import images
+from ..images import generate_variants
+
+
+@pytest.fixture
+def fs():
+    mongomock.gridfs.enable_gridfs_integration()
+    fs = gridfs.GridFS(mongomock.MongoClient().db)
+    buffer = io.BytesIO()
+    Image.new('RGB', (800, 600), 'red').save(buffer, 'PNG')
+    fs.original_id = fs.put(buffer.getvalue(), filename='a.png', content_type='image/png')
+    return fs
+
+
+def test_format_without_encoder_is_skipped(fs, monkeypatch):
+    encode = images._encode_variant
+
+    def encode_without_webp(image, size, pil_format):
+        if pil_format == 'WEBP':
+            raise KeyError('WEBP')
+        return encode(image, size, pil_format)
+
+    monkeypatch.setattr(images, '_encode_variant', encode_without_webp)
+    variants = generate_variants(fs, fs.original_id, ('card', 'detail'))
+
+    assert set(variants) == {'card', 'detail'}
+    assert all(set(formats) == {'jpeg'} for formats in variants.values())
+
+
+def test_failed_write_deletes_stored_variants(fs, monkeypatch):
+    put = fs.put
+    calls = []
+
+    def failing_put(data, **kwargs):
+        calls.append(kwargs['filename'])
+        if len(calls) == 3:
+            raise AutoReconnect('connection closed')
+        return put(data, **kwargs)
+
+    monkeypatch.setattr(fs, 'put', failing_put)
+    with pytest.raises(AutoReconnect):
+        generate_variants(fs, fs.original_id, ('card', 'detail'))
+
+    assert len(calls) == 3
+    assert [grid_out._id for grid_out in fs.find({})] == [fs.original_id]
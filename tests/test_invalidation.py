@@ -0,0 +1,96 @@
+import os
+import time
+import uuid
+
+import pytest
+from flask import Flask
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from .. import create_app
+from ..invalidation import publish_ad_changed, publish_invalidation
+from ..signals import ad_changed
+
+
+class FakeBus:
+    def __init__(self):
+        self.events = []
+
+    def publish(self, kind, **payload):
+        self.events.append((kind, payload))
+
+
+def test_remote_ad_change_is_not_published_again():
+    app = Flask(__name__)
+    app.config['INVALIDATION_BUS'] = bus = FakeBus()
+    ad = {'_id': 1, 'category': 'Sport', 'title': 'Bicikl'}
+
+    publish_ad_changed(app, old=None, new=ad)
+    # Događaj primljen iz drugog procesa ne smije se vratiti na sabirnicu
+    publish_ad_changed(app, old=None, new=ad, remote=True)
+
+    assert bus.events == [('ad', {'old': None, 'new': {'_id': 1, 'category': 'Sport'}})]
+
+
+@pytest.fixture
+def mongodb_uri():
+    """Stvarni mongod (MONGODB_TEST_URI) - capped kolekcija i tailable cursor nisu podržani u mongomocku"""
+    uri = os.getenv('MONGODB_TEST_URI', 'mongodb://localhost:27017/')
+    client = MongoClient(uri, serverSelectionTimeoutMS=500)
+    try:
+        client.admin.command('ping')
+    except PyMongoError:
+        pytest.skip('MongoDB nije dostupan (MONGODB_TEST_URI)')
+    finally:
+        client.close()
+    return uri
+
+
+def _wait_until(publish, done, timeout=10):
+    """Objavljuje dok primatelj ne primijeni događaj (čitanje prvog može krenuti nakon objave)"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        publish()
+        for _ in range(20):
+            if done():
+                return True
+            time.sleep(0.05)
+    return False
+
+
+def test_event_published_by_one_process_invalidates_another(mongodb_uri, monkeypatch):
+    db_name = f'test_invalidation_{uuid.uuid4().hex[:8]}'
+    monkeypatch.setenv('MONGODB_URI', mongodb_uri)
+    monkeypatch.setenv('MONGODB_DB', db_name)
+    monkeypatch.setenv('INVALIDATION_BUS', 'capped')
+    monkeypatch.setenv('MONGODB_ENSURE_INDEXES', 'False')
+    monkeypatch.setenv('PASSWORD_HASH_WORKERS', '0')
+    # Dvije aplikacije = dva procesa s vlastitim cachevima i sabirnicom (različit origin)
+    publisher, receiver = create_app('testing'), create_app('testing')
+    receiver.config['INVALIDATION_BUS'].start()
+    try:
+        counter = receiver.config['AD_COUNTER']
+        pages = receiver.config['RESPONSE_CACHE']
+        users = receiver.config['USER_CACHE']
+        count_key = counter.make_key(category='Sport')
+        counter.cache.set(count_key, 7)
+        pages.set('/ads/', ('<html>', 200, {}))
+        users.set('u1', {'username': 'ana'})
+
+        ad = {'_id': 1, 'category': 'Sport', 'user_id': None, 'price': 100}
+        with publisher.app_context():
+            assert _wait_until(
+                lambda: ad_changed.send(publisher, old=None, new=ad),
+                lambda: counter.cache.get(count_key) is None and pages.get('/ads/') is None
+            )
+            assert _wait_until(lambda: publish_invalidation('user', 'u1'), lambda: users.get('u1') is None)
+
+        # Izdavač vlastite događaje ne prima - njegovi cachevi su već ažurirani lokalno
+        assert publisher.config['INVALIDATION_BUS'].stats()['received'] == 0
+        assert receiver.config['INVALIDATION_BUS'].stats()['applied'] >= 2
+    finally:
+        for app in (publisher, receiver):
+            app.config['INVALIDATION_BUS'].stop()
+        client = MongoClient(mongodb_uri)
+        client.drop_database(db_name)
+        client.close()
@@ -0,0 +1,71 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Flask
+
+from ..mailer import EmailDispatcher
+
+
+class FakeMessage:
+    def __init__(self, recipients, fail=False):
+        self.recipients = recipients
+        self.fail = fail
+
+
+class FakeConnection:
+    """Zamjena za SMTP vezu - poruka s fail=True podiže grešku koja nije SMTPException"""
+
+    def __init__(self, sent, release=None):
+        self.sent = sent
+        self.release = release
+
+    def send(self, msg):
+        if self.release is not None:
+            self.release.wait(5)
+        if msg.fail:
+            raise AssertionError('No recipients have been added')
+        self.sent.append(msg)
+
+
+def _dispatcher(connection, **kwargs):
+    @contextmanager
+    def connect():
+        yield connection
+
+    return EmailDispatcher(Flask(__name__), connect=connect, backoff=0, **kwargs)
+
+
+def test_worker_survives_failing_message():
+    sent = []
+    dispatcher = _dispatcher(FakeConnection(sent), workers=1)
+    assert dispatcher.submit(FakeMessage([], fail=True))
+    assert dispatcher.submit(FakeMessage(['a@example.com']))
+    # Čekanje s rokom - mrtav radnik bi inače zauvijek blokirao test
+    deadline = time.monotonic() + 5
+    while dispatcher._queue.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    stats = dispatcher.stats()
+    assert [msg.recipients for msg in sent] == [['a@example.com']]
+    assert stats['failed'] == 1
+    assert stats['sent'] == 1
+    assert stats['workers'] == 1
+    dispatcher.shutdown(timeout=1)
+
+
+def test_shutdown_returns_when_queue_is_full():
+    release = threading.Event()
+    dispatcher = _dispatcher(FakeConnection([], release), workers=1, queue_size=1)
+    dispatcher.submit(FakeMessage(['a@example.com']))
+    # Radnik je zauzet prvom porukom, druga popunjava red
+    deadline = time.monotonic() + 2
+    while dispatcher._queue.qsize() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert dispatcher.submit(FakeMessage(['b@example.com']))
+    assert not dispatcher.submit(FakeMessage(['c@example.com']))
+
+    started = time.monotonic()
+    dispatcher.shutdown(timeout=0.3)
+    assert time.monotonic() - started < 2
+    release.set()
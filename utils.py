@@ -1,5 +1,11 @@
+import base64
+import binascii
+import hashlib
+import json
 import markdown2
 import bleach
+from bson import json_util
+from bson.errors import InvalidId
 
 # Markdown konfiguracija
 ALLOWED_TAGS = [
@@ -11,19 +17,110 @@ ALLOWED_ATTRIBUTES = {
     'code': ['class']
 }
 
+MARKDOWN_EXTRAS = ['fenced-code-blocks', 'tables', 'break-on-newline']
+
+# Duljina opisa (u znakovima) prikazana na karticama oglasa
+EXCERPT_LENGTH = 150
+
+# Povećaj ručno kad se promijeni renderiranje na način koji nije vidljiv iz konfiguracije
+RENDERER_REVISION = 2
+
+def _renderer_version():
+    """Oznaka verzije renderera - mijenja se sa svakom promjenom pravila renderiranja"""
+    payload = json.dumps([
+        RENDERER_REVISION, sorted(ALLOWED_TAGS), ALLOWED_ATTRIBUTES, MARKDOWN_EXTRAS, EXCERPT_LENGTH,
+        markdown2.__version__, bleach.__version__
+    ], sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:12]
+
+RENDERER_VERSION = _renderer_version()
+
 def markdown_to_html(text):
     """Pretvara Markdown u sanitizirani HTML"""
     if not text:
         return ""
     # Pretvori Markdown u HTML
-    html = markdown2.markdown(text, extras=['fenced-code-blocks', 'tables', 'break-on-newline'])
+    html = markdown2.markdown(text, extras=MARKDOWN_EXTRAS)
     # Sanitiziraj HTML da spriječiš XSS
     clean_html = bleach.clean(html, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES, strip=True)
     return clean_html
 
-def get_pagination_info(page, per_page, total):
-    """Izračunava paginacijske podatke"""
+def render_description_fields(description):
+    """Polja s unaprijed renderiranim opisom (i izvatkom za kartice) koja se spremaju uz oglas"""
+    description = description or ''
+    excerpt = description[:EXCERPT_LENGTH] + '...' if len(description) > EXCERPT_LENGTH else description
+    return {
+        'description_html': markdown_to_html(description),
+        'excerpt_html': markdown_to_html(excerpt),
+        'description_html_version': RENDERER_VERSION
+    }
+
+def ensure_excerpts(ads, ads_collection):
+    """Popunjava excerpt_html za oglase spremljene sa starom verzijom renderera.
+
+    Kartice se dohvaćaju bez opisa, pa se opis čita (i izvadak sprema) samo
+    za zastarjele oglase - nakon backfilla ovo ne radi nijedan upit.
+    """
+    stale = {ad['_id']: ad for ad in ads if ad.get('description_html_version') != RENDERER_VERSION}
+    if not stale:
+        return ads
+    for doc in ads_collection.find({'_id': {'$in': list(stale)}}, {'description': 1}):
+        fields = render_description_fields(doc.get('description'))
+        ads_collection.update_one({'_id': doc['_id'], 'description': doc.get('description')}, {'$set': fields})
+        stale[doc['_id']]['excerpt_html'] = fields['excerpt_html']
+    return ads
+
+def get_description_html(ad, ads_collection=None):
+    """Vraća spremljeni HTML opisa; zastarjeli ili nepostojeći se renderira i (lijeno) sprema"""
+    if ad.get('description_html_version') == RENDERER_VERSION:
+        return ad['description_html']
+    fields = render_description_fields(ad.get('description'))
+    if ads_collection is not None:
+        # Uvjet na description sprječava prepisivanje ako je oglas u međuvremenu uređen
+        ads_collection.update_one(
+            {'_id': ad['_id'], 'description': ad.get('description')},
+            {'$set': fields}
+        )
+    return fields['description_html']
+
+def encode_cursor(doc, sort_field='created_at'):
+    """Kodira poziciju dokumenta (vrijednost sort polja + _id) u neprozirni token"""
+    # Oglas bez polja (npr. views prije backfilla) sortira se kao null
+    payload = json_util.dumps({'v': doc.get(sort_field), 'id': doc['_id']})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(token):
+    """Dekodira paginacijski token u (vrijednost, _id) ili vraća None ako token nije ispravan"""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json_util.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return payload['v'], payload['id']
+    except (ValueError, KeyError, TypeError, InvalidId, binascii.Error):
+        return None
+
+def keyset_filter(value, doc_id, sort_field='created_at', before=False):
+    """Filter za dohvat dokumenata nakon (ili prije) zadane pozicije.
+
+    Sortiranje je silazno po (sort_field, _id); gornja granica na sort_field
+    omogućuje da se upit odradi kao raspon po indeksu.
+    """
+    if before:
+        return {sort_field: {'$gte': value},
+                '$or': [{sort_field: {'$gt': value}}, {'_id': {'$gt': doc_id}}]}
+    return {sort_field: {'$lte': value},
+            '$or': [{sort_field: {'$lt': value}}, {'_id': {'$lt': doc_id}}]}
+
+def get_pagination_info(page, per_page, total, has_next=None, prev_cursor=None, next_cursor=None):
+    """Izračunava paginacijske podatke.
+
+    U cursor načinu rada has_next dolazi iz samog dohvata (per_page + 1 dokument),
+    a prev_cursor/next_cursor se prosljeđuju kao before/after parametri u linkovima.
+    """
     total_pages = (total + per_page - 1) // per_page  # Ceiling division
+    if has_next is None:
+        has_next = page < total_pages
     
     return {
         'page': page,
@@ -31,13 +128,25 @@ def get_pagination_info(page, per_page, total):
         'total': total,
         'total_pages': total_pages,
         'has_prev': page > 1,
-        'has_next': page < total_pages,
+        'has_next': has_next,
         'prev_num': page - 1 if page > 1 else None,
-        'next_num': page + 1 if page < total_pages else None
+        'next_num': page + 1 if has_next else None,
+        'prev_cursor': prev_cursor,
+        'next_cursor': next_cursor
     }
 
-def get_pagination_range(current_page, total_pages, delta=2):
-    """Generira raspon stranica za prikaz u paginaciji"""
+def get_pagination_range(current_page, total_pages, delta=2, max_page=None):
+    """Generira raspon stranica za prikaz u paginaciji.
+
+    Ako je zadan max_page, numerirani linkovi ne idu dalje od njega (dublje
+    stranice dostupne su samo preko prethodna/sljedeća linkova).
+    """
+    if max_page is not None:
+        total_pages = min(total_pages, max_page)
+    if current_page > total_pages:
+        # Duboka stranica dosegnuta cursorom - prikaži samo prvu i trenutnu
+        return [1, '...', current_page] if current_page > 2 else list(range(1, current_page + 1))
+    
     start = max(1, current_page - delta)
     end = min(total_pages, current_page + delta)
     